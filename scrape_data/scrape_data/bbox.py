@@ -0,0 +1,89 @@
+# bbox.py
+# Lọc thô bằng bounding box trước khi geocode.
+#
+# Query "nhà thuốc tại Huyện Ba Vì" trả về nhiều card ở tận tỉnh khác; so 4 số min/max rẻ hơn rất nhiều
+# so với 1 request Nominatim. Hộp của mỗi (tỉnh, huyện) lấy từ:
+#   - polygon ranh giới (boundaries.py) nếu có
+#   - hoặc toạ độ các cửa hàng đã lưu trong grocery_stores
+# cộng thêm lề. Hai quy tắc loại:
+#   - hộp từ ranh giới (lề BBOX_MARGIN_DEG): giữ kiểu "nhẹ tay" của in_target_area (huyện HOẶC tỉnh),
+#     card chỉ bị loại khi nằm ngoài cả hộp huyện lẫn hộp tỉnh
+#   - hộp từ grocery_stores (huyện có >= BBOX_MIN_POINTS điểm, lề rộng hơn BBOX_STORE_MARGIN_DEG): loại card
+#     nằm ngoài hộp huyện. Hộp tỉnh gộp từ cửa hàng thiếu các huyện chưa crawl nên không dùng.
+#     Đánh đổi: card thật của huyện nhưng xa hơn lề so với mọi cửa hàng đã biết, hoặc card ở huyện khác
+#     cùng tỉnh (in_target_area vẫn nhận theo tỉnh) sẽ bị loại → tăng BBOX_STORE_MARGIN_DEG nếu mất card.
+
+from config import BBOX_MARGIN_DEG, BBOX_STORE_MARGIN_DEG, BBOX_MIN_POINTS
+from boundaries import district_key, get_index
+
+
+def _merge(a, b):
+    if a is None:
+        return b
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+class BBoxIndex:
+    """(tỉnh, huyện) chuẩn hoá → (min_lng, min_lat, max_lng, max_lat); kèm hộp gộp cấp tỉnh."""
+
+    def __init__(self, margin=BBOX_MARGIN_DEG, store_margin=BBOX_STORE_MARGIN_DEG):
+        self.margin = margin
+        self.store_margin = store_margin
+        self._district = {}
+        self._province = {}      # chỉ từ polygon ranh giới
+        self._from_stores = set()   # huyện có hộp dựng từ grocery_stores
+
+    def __len__(self):
+        return len(self._district)
+
+    def add_boundaries(self, boundary_index):
+        for key, box in boundary_index.bounds_by_key().items():
+            self._district[key] = _merge(self._district.get(key), box)
+            self._province[key[0]] = _merge(self._province.get(key[0]), box)
+
+    def add_stores(self, cur, min_points=BBOX_MIN_POINTS):
+        """Hộp từ toạ độ đã lưu; chỉ dùng huyện có đủ điểm và chưa có hộp từ ranh giới."""
+        cur.execute("""
+            SELECT province, district,
+                   MIN(longitude), MIN(latitude), MAX(longitude), MAX(latitude)
+            FROM grocery_stores
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            GROUP BY province, district
+            HAVING COUNT(*) >= %s;
+        """, (min_points,))
+        rows = cur.fetchall()
+        cur.connection.commit()
+        from_boundaries = set(self._district)
+        for province, district, *box in rows:
+            key = district_key(province or "", district or "")
+            if key not in from_boundaries:
+                self._district[key] = _merge(self._district.get(key), tuple(box))
+                self._from_stores.add(key)
+
+    def _inside(self, box, lat, lng, m):
+        return box[0] - m <= lng <= box[2] + m and box[1] - m <= lat <= box[3] + m
+
+    def check(self, lat, lng, district, province):
+        """
+        True nếu có thể thuộc địa bàn, False nếu ngoài (xem quy tắc ở đầu file), None nếu huyện chưa có hộp.
+        """
+        key = district_key(province, district)
+        dbox = self._district.get(key)
+        if dbox is None:
+            return None
+        latf, lngf = float(lat), float(lng)
+        if key in self._from_stores:
+            return self._inside(dbox, latf, lngf, self.store_margin)
+        if self._inside(dbox, latf, lngf, self.margin):
+            return True
+        return self._inside(self._province[key[0]], latf, lngf, self.margin)
+
+
+def build_bbox_index(cur):
+    """Dựng BBoxIndex từ ranh giới (nếu nạp được) + grocery_stores."""
+    idx = BBoxIndex()
+    boundary = get_index()
+    if boundary is not None:
+        idx.add_boundaries(boundary)
+    idx.add_stores(cur)
+    return idx
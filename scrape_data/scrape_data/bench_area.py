@@ -0,0 +1,112 @@
+# bench_area.py
+# Micro-benchmark in_target_area: bản cũ (sinh biến thể + quét từng chuỗi mỗi card)
+# so với matcher biên dịch sẵn trong filters.py, trên tập địa chỉ tổng hợp.
+#
+# Chạy: python bench_area.py [--n 200000] [--seed 1]
+
+import re
+import time
+import random
+import argparse
+import unicodedata
+
+from config import PROVINCE_DISTRICTS
+import filters
+from filters import in_target_area, _PFX_DIST, _PFX_PROV
+
+
+# ========= Bản cũ (giữ nguyên thuật toán trước khi tối ưu) để so tốc độ + kết quả =========
+
+def _old_strip_accents(s):
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+def _old_norm(s):
+    s = _old_strip_accents(s or "").lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+def _old_remove_leading_prefix(s, prefixes):
+    ns = _old_norm(s)
+    for p in sorted(prefixes, key=len, reverse=True):
+        p_norm = _old_norm(p)
+        if ns.startswith(p_norm + " "):
+            return ns[len(p_norm):].strip()
+    return ns
+
+def _old_variants(name, prefixes, short):
+    bare = _old_remove_leading_prefix(name, prefixes)
+    variants = {_old_norm(name), bare}
+    for p in short:
+        variants.add(f"{p} {bare}")
+    return {v.strip() for v in variants if v.strip()}
+
+def old_in_target_area(addr, district, province):
+    if not addr:
+        return False
+    addr_norm = _old_norm(addr)
+    dvars = _old_variants(district, _PFX_DIST,
+                          ["huyen", "h.", "h", "quan", "q.", "q", "thi xa", "tx.", "tx", "thanh pho", "tp.", "tp"])
+    pvars = _old_variants(province, _PFX_PROV, ["thanh pho", "tp.", "tp", "tinh"])
+    return any(v in addr_norm for v in dvars) or any(v in addr_norm for v in pvars)
+
+
+# ========= Dữ liệu tổng hợp =========
+
+_STREETS = ["Nguyễn Trãi", "Lê Lợi", "Trần Hưng Đạo", "Quốc lộ 32", "Hùng Vương", "Tỉnh lộ 87"]
+_WARDS = ["Xã Tản Lĩnh", "Phường Quang Trung", "Thị trấn Tây Đằng", "Xã Vân Hòa", "Phường 7"]
+
+def make_cases(n, seed):
+    """(addr, district, province) — ~1/3 đúng huyện, ~1/3 đúng tỉnh khác huyện, còn lại tỉnh khác."""
+    rnd = random.Random(seed)
+    combos = [(p, d) for p, ds in PROVINCE_DISTRICTS.items() for d in ds]
+    cases = []
+    for _ in range(n):
+        province, district = rnd.choice(combos)
+        roll = rnd.random()
+        if roll < 0.33:
+            ap, ad = province, district
+        elif roll < 0.66:
+            ap, ad = province, rnd.choice(PROVINCE_DISTRICTS[province])
+        else:
+            ap, ad = rnd.choice(combos)
+        addr = (f"{rnd.randint(1, 300)} {rnd.choice(_STREETS)}, {rnd.choice(_WARDS)}, "
+                f"{ad}, {ap}, {rnd.randint(10000, 99999)}, Việt Nam")
+        cases.append((addr, district, province))
+    return cases
+
+
+def _bench(fn, cases):
+    t0 = time.perf_counter()
+    out = [fn(a, d, p) for a, d, p in cases]
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark in_target_area cũ vs matcher biên dịch sẵn")
+    ap.add_argument("--n", type=int, default=200000)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    cases = make_cases(args.n, args.seed)
+
+    old_out, old_t = _bench(old_in_target_area, cases)
+
+    filters._norm.cache_clear()
+    filters.area_matcher.cache_clear()
+    new_out, new_t = _bench(in_target_area, cases)
+
+    mismatches = sum(1 for a, b in zip(old_out, new_out) if a != b)
+    print(f"Địa chỉ: {args.n} | pass: {sum(new_out)}")
+    print(f"Cũ     : {args.n / old_t:12,.0f} địa chỉ/s ({old_t:.2f}s)")
+    print(f"Mới    : {args.n / new_t:12,.0f} địa chỉ/s ({new_t:.2f}s)  x{old_t / new_t:.1f}")
+    print(f"Lệch kết quả: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
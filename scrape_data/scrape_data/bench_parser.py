@@ -0,0 +1,247 @@
+# bench_parser.py
+# Benchmark + kiểm tra hồi quy cho parser (mọi backend), categorize và in_target_area,
+# chạy offline trên feed Google Maps đã ghi lại (fixtures/feeds/*.html, đã ẩn danh).
+#
+# - Đúng/sai: output của từng backend so với fixtures/expected_cards.json (từng trường),
+#   in_target_area so với fixtures/area_cases.json → lệch thì exit 1
+# - Tốc độ: card/s (lấy vòng nhanh nhất), bộ nhớ đỉnh + số block còn giữ sau khi parse (tracemalloc:
+#   chỉ thấy heap Python, bộ nhớ C của libxml2/lexbor không được tính)
+# - Thêm/sửa fixture: chép HTML feed (đã ẩn danh) vào fixtures/feeds/, chạy --update rồi soát lại diff
+# - Trang cỡ thật (fixtures/pages/*.html: cả page_source, vài trăm card): đo từng trang 1 lượt, không nhân
+#   --repeat → thấy cả chi phí tách card / duyệt cả document; đúng/sai so với backend bs4 trên cùng trang.
+#   Thêm trang ghi thật: lưu driver.page_source sau khi cuộn hết feed rồi
+#   python bench_parser.py --import-page page.html ten_trang  (ẩn danh tên/place_id/SĐT/ảnh/script)
+#
+# Chạy: python bench_parser.py [--repeat 50] [--rounds 3] [--backend lxml] [--update] [--import-page SRC NAME]
+
+import argparse
+import gc
+import glob
+import json
+import os
+import re
+import time
+import tracemalloc
+from decimal import Decimal
+
+from parser import available_backends, parse_cards, split_cards, categorize, BACKEND_BS4
+from filters import in_target_area
+import filters
+
+_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+_FEEDS = os.path.join(_FIXTURES, "feeds")
+_PAGES = os.path.join(_FIXTURES, "pages")
+_EXPECTED = os.path.join(_FIXTURES, "expected_cards.json")
+_AREA_CASES = os.path.join(_FIXTURES, "area_cases.json")
+
+
+def load_feeds(folder=_FEEDS):
+    """{tên feed: HTML} theo thứ tự tên file."""
+    feeds = {}
+    for path in sorted(glob.glob(os.path.join(folder, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            feeds[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return feeds
+
+
+# ========= Ẩn danh trang ghi thật =========
+
+_ANON_RULES = [
+    # (regex, hàm tạo giá trị giả từ số thứ tự) — cùng giá trị gốc thì cùng giá trị giả
+    (re.compile(r"(?<=!19s)[^!?&\"]+"), lambda n: f"ChIJ_ANON_{n:04d}"),
+    (re.compile(r"(?<=!1s)0x[0-9a-f]+:0x[0-9a-f]+"), lambda n: f"0x3135ab00anon:0x{n:04x}"),
+    (re.compile(r"(?<=!16s)[^!?&\"]+"), lambda n: f"%2Fg%2F11anon{n}"),
+    (re.compile(r"https://lh\d\.googleusercontent\.com/[^\"'\s)]+"),
+     lambda n: f"https://lh5.googleusercontent.com/p/ANON{n}=w80-h106-k-no"),
+    (re.compile(r'(?<=<span class="UsdlK">)[^<]+'), lambda n: f"0900 {n // 1000:03d} {n % 1000:03d}"),
+]
+_CARD_NAME_RE = re.compile(r'<a class="hfpxzc" aria-label="([^"]+)"')
+_SCRIPT_RE = re.compile(r"(<script[^>]*>)(.*?)(</script>)", re.S)
+
+
+def anonymize_page(html):
+    """
+    page_source thật → fixture: tên (giữ 2 từ đầu để categorize vẫn đúng loại), place_id, feature id,
+    SĐT, ảnh thay bằng giá trị giả nhất quán; nội dung <script> (chứa dữ liệu phiên / dữ liệu địa điểm)
+    thay bằng khoảng trắng cùng độ dài để kích thước document giữ nguyên. Toạ độ giữ nguyên.
+    """
+    html = _SCRIPT_RE.sub(lambda m: m.group(1) + " " * len(m.group(2)) + m.group(3), html)
+    names = {}
+    for name in _CARD_NAME_RE.findall(html):
+        names.setdefault(name, " ".join(name.split()[:2] + ["Mẫu", str(len(names) + 1)]))
+    for name, fake in sorted(names.items(), key=lambda kv: -len(kv[0])):
+        html = html.replace(name, fake).replace(name.replace(" ", "+"), fake.replace(" ", "+"))
+    for rx, fake in _ANON_RULES:
+        seen = {}
+        html = rx.sub(lambda m: seen.setdefault(m.group(0), fake(len(seen) + 1)), html)
+    return html
+
+
+def _jsonable(card):
+    return {k: str(v) if isinstance(v, Decimal) else v for k, v in card.items()}
+
+
+# ========= Hồi quy =========
+
+def check_cards(feeds, expected, backend):
+    """Danh sách lỗi (chuỗi mô tả) khi so output backend với expected."""
+    errors = []
+    for name, html in feeds.items():
+        want = expected.get(name)
+        if want is None:
+            errors.append(f"{name}: chưa có expected (chạy --update)")
+            continue
+        got = [_jsonable(c) for c in parse_cards(html, backend)]
+        if len(got) != len(want):
+            errors.append(f"{name}: {len(got)} card, cần {len(want)}")
+        for i, (g, w) in enumerate(zip(got, want)):
+            for field in sorted(set(g) | set(w)):
+                if g.get(field) != w.get(field):
+                    errors.append(f"{name}#{i} {field}: {g.get(field)!r} != {w.get(field)!r}")
+    return errors
+
+
+def check_same_as_bs4(pages, backend):
+    """Trang cỡ thật không có expected lưu sẵn: so output backend với bs4 trên cùng trang."""
+    errors = []
+    for name, html in pages.items():
+        want = [_jsonable(c) for c in parse_cards(html, BACKEND_BS4)]
+        got = [_jsonable(c) for c in parse_cards(html, backend)]
+        if len(got) != len(want):
+            errors.append(f"{name}: {len(got)} card, bs4 ra {len(want)}")
+        for i, (g, w) in enumerate(zip(got, want)):
+            if g != w:
+                errors.append(f"{name}#{i}: khác bs4 ở {sorted(k for k in set(g) | set(w) if g.get(k) != w.get(k))}")
+    return errors
+
+
+def check_area(cases):
+    return [f"in_target_area({c['addr']!r}, {c['district']!r}, {c['province']!r}) != {c['expected']}"
+            for c in cases if in_target_area(c["addr"], c["district"], c["province"]) != c["expected"]]
+
+
+# ========= Tốc độ / bộ nhớ =========
+
+def _best(fn, rounds):
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def bench_backend(html, backend, rounds):
+    """(số card, giây/vòng nhanh nhất, KiB đỉnh, số block còn giữ sau parse + gc)."""
+    n = len(parse_cards(html, backend))
+    secs = _best(lambda: parse_cards(html, backend), rounds)
+
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    cards = parse_cards(html, backend)
+    peak = tracemalloc.get_traced_memory()[1]
+    gc.collect()   # cây bs4 có vòng tham chiếu, chỉ được giải phóng khi gc chạy
+    blocks = sum(s.count_diff for s in tracemalloc.take_snapshot().compare_to(base, "filename"))
+    tracemalloc.stop()
+    del cards
+    return n, secs, peak / 1024, blocks
+
+
+def bench_page(html, backend, rounds):
+    """(số card, ms tách card, ms tách + parse) cho 1 trang, 1 lượt (lấy vòng nhanh nhất)."""
+    n = len(split_cards(html, backend)[0])
+    split_secs = _best(lambda: split_cards(html, backend), rounds)
+    secs = _best(lambda: parse_cards(html, backend), rounds)
+    return n, split_secs * 1000, secs * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark + kiểm tra hồi quy parser trên feed ghi sẵn (offline)")
+    ap.add_argument("--repeat", type=int, default=50, help="nhân mỗi feed N lần để đo tốc độ")
+    ap.add_argument("--rounds", type=int, default=3, help="số vòng đo, lấy vòng nhanh nhất")
+    ap.add_argument("--backend", action="append", help="chỉ đo backend này (lặp được); mặc định mọi backend đã cài")
+    ap.add_argument("--update", action="store_true", help="ghi lại expected_cards.json từ backend bs4")
+    ap.add_argument("--import-page", nargs=2, metavar=("SRC", "NAME"),
+                    help="ẩn danh 1 page_source đã lưu thành fixtures/pages/NAME.html")
+    args = ap.parse_args()
+
+    if args.import_page:
+        src, name = args.import_page
+        with open(src, encoding="utf-8") as f:
+            html = anonymize_page(f.read())
+        os.makedirs(_PAGES, exist_ok=True)
+        dst = os.path.join(_PAGES, f"{name}.html")
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write(html)
+        print(f"[INFO] Đã ghi {dst} ({len(parse_cards(html, BACKEND_BS4))} card, {len(html) / 1024:,.0f} KiB) — soát lại trước khi commit")
+        return
+
+    feeds = load_feeds()
+    if not feeds:
+        raise SystemExit(f"[ERROR] Không có fixture trong {_FEEDS}")
+
+    if args.update:
+        expected = {name: [_jsonable(c) for c in parse_cards(html, BACKEND_BS4)] for name, html in feeds.items()}
+        with open(_EXPECTED, "w", encoding="utf-8") as f:
+            json.dump(expected, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        print(f"[INFO] Đã ghi {_EXPECTED} ({sum(map(len, expected.values()))} card)")
+        return
+
+    with open(_EXPECTED, encoding="utf-8") as f:
+        expected = json.load(f)
+    with open(_AREA_CASES, encoding="utf-8") as f:
+        area_cases = json.load(f)
+
+    backends = args.backend or available_backends()
+    big = "".join(feeds.values()) * args.repeat
+    failures = 0
+
+    print(f"Feed: {len(feeds)} file, đo trên {args.repeat}x | backend: {', '.join(backends)}")
+    print(f"{'backend':11s} {'card':>7s} {'card/s':>12s} {'peak KiB':>10s} {'block giữ':>10s}  lệch")
+    for backend in backends:
+        errors = check_cards(feeds, expected, backend)
+        n, secs, peak_kib, blocks = bench_backend(big, backend, args.rounds)
+        print(f"{backend:11s} {n:7d} {n / secs:12,.0f} {peak_kib:10,.0f} {blocks:10,d}  {len(errors)}")
+        for e in errors[:20]:
+            print(f"   [LỆCH] {e}")
+        failures += len(errors)
+
+    pages = load_feeds(_PAGES)
+    if pages:
+        print(f"\nTrang cỡ thật (1 lượt / trang, không nhân --repeat):")
+        print(f"{'backend':11s} {'trang':18s} {'KiB':>6s} {'card':>5s} {'ms tách':>8s} {'ms tổng':>8s} {'card/s':>9s}  lệch bs4")
+        for backend in backends:
+            errors = check_same_as_bs4(pages, backend) if backend != BACKEND_BS4 else []
+            for name, html in pages.items():
+                n, split_ms, total_ms = bench_page(html, backend, args.rounds)
+                print(f"{backend:11s} {name:18s} {len(html) / 1024:6,.0f} {n:5d} {split_ms:8.1f} {total_ms:8.1f} "
+                      f"{n / total_ms * 1000:9,.0f}  {len(errors)}")
+            for e in errors[:20]:
+                print(f"   [LỆCH] {e}")
+            failures += len(errors)
+        print()
+
+    names = [c["name"] for cards in expected.values() for c in cards] * args.repeat * 20
+    secs = _best(lambda: [categorize(n) for n in names], args.rounds)
+    print(f"categorize     : {len(names) / secs:12,.0f} tên/s")
+
+    area_errors = check_area(area_cases)
+    cases = area_cases * args.repeat * 20
+    filters._norm.cache_clear()
+    filters.area_matcher.cache_clear()
+    secs = _best(lambda: [in_target_area(c["addr"], c["district"], c["province"]) for c in cases], args.rounds)
+    print(f"in_target_area : {len(cases) / secs:12,.0f} địa chỉ/s  lệch {len(area_errors)}")
+    for e in area_errors:
+        print(f"   [LỆCH] {e}")
+    failures += len(area_errors)
+
+    if failures:
+        print(f"[FAIL] {failures} chỗ lệch so với fixture")
+        raise SystemExit(1)
+    print("[OK] Output khớp fixture")
+
+
+if __name__ == "__main__":
+    main()
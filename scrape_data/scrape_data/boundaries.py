@@ -0,0 +1,121 @@
+# boundaries.py
+# Xác định card thuộc tỉnh/huyện nào bằng point-in-polygon (offline), không cần Nominatim.
+#
+# - Nạp ranh giới hành chính cấp huyện (GeoJSON, hoặc .shp nếu có pyshp) vào STRtree của shapely
+# - Khớp tên feature với PROVINCE_DISTRICTS bằng tên chuẩn hoá (bỏ dấu, bỏ tiền tố Huyện/Quận/Tỉnh/TP...)
+# - in_area(): True/False nếu có ranh giới cho combo, None nếu không có dữ liệu → quay về lọc theo địa chỉ
+#
+# shapely là phụ thuộc tuỳ chọn: không cài hoặc không cấu hình BOUNDARY_PATH thì module này im lặng tắt.
+
+import json
+
+from config import BOUNDARY_PATH, BOUNDARY_PROVINCE_PROP, BOUNDARY_DISTRICT_PROP
+from filters import _remove_leading_prefix, _PFX_DIST, _PFX_PROV
+
+try:
+    from shapely import points as _points
+    from shapely.geometry import shape
+    from shapely.strtree import STRtree
+except ImportError:  # shapely < 2 hoặc chưa cài
+    STRtree = None
+
+
+def province_key(province):
+    return _remove_leading_prefix(province, _PFX_PROV)
+
+
+def district_key(province, district):
+    return (province_key(province), _remove_leading_prefix(district, _PFX_DIST))
+
+
+def _read_features(path):
+    if path.lower().endswith(".shp"):
+        import shapefile  # pyshp
+        with shapefile.Reader(path) as sf:
+            return [sr.__geo_interface__ for sr in sf.shapeRecords()]
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["features"]
+
+
+class BoundaryIndex:
+    """STRtree trên polygon cấp huyện; mỗi polygon gắn khoá (tỉnh, huyện) đã chuẩn hoá."""
+
+    def __init__(self, features, province_prop=BOUNDARY_PROVINCE_PROP, district_prop=BOUNDARY_DISTRICT_PROP):
+        geoms, keys = [], []
+        for feat in features:
+            props = feat.get("properties") or {}
+            prov, dist = props.get(province_prop), props.get(district_prop)
+            if not prov or not dist or not feat.get("geometry"):
+                continue
+            geoms.append(shape(feat["geometry"]))
+            keys.append(district_key(prov, dist))
+
+        self._geoms = geoms
+        self._keys = keys
+        self._tree = STRtree(geoms)
+        self.district_keys = set(keys)
+        self.province_keys = {k[0] for k in keys}
+
+    def __len__(self):
+        return len(self._geoms)
+
+    def bounds_by_key(self):
+        """Khoá (tỉnh, huyện) → (min_lng, min_lat, max_lng, max_lat) gộp mọi polygon của huyện."""
+        out = {}
+        for key, geom in zip(self._keys, self._geoms):
+            b = geom.bounds
+            if key in out:
+                o = out[key]
+                b = (min(o[0], b[0]), min(o[1], b[1]), max(o[2], b[2]), max(o[3], b[3]))
+            out[key] = b
+        return out
+
+    def locate(self, lat, lng):
+        """Các khoá (tỉnh, huyện) có polygon chứa điểm (thường 0 hoặc 1)."""
+        idx = self._tree.query(_points(float(lng), float(lat)), predicate="intersects")
+        return [self._keys[i] for i in idx]
+
+    def in_area(self, lat, lng, district, province):
+        """
+        Cùng quy tắc "nhẹ tay" như filters.in_target_area: nằm trong huyện HOẶC trong tỉnh.
+        None nếu không có polygon cho tỉnh này (không kết luận được).
+        """
+        dkey = district_key(province, district)
+        if dkey[0] not in self.province_keys:
+            return None
+        for key in self.locate(lat, lng):
+            if key == dkey or key[0] == dkey[0]:
+                return True
+        return False
+
+
+_index = None
+_loaded = False
+
+
+def get_index():
+    """Nạp BoundaryIndex 1 lần mỗi tiến trình; None nếu tắt/thiếu shapely/lỗi file."""
+    global _index, _loaded
+    if _loaded:
+        return _index
+    _loaded = True
+    if not BOUNDARY_PATH:
+        return None
+    if STRtree is None:
+        print("[WARN] BOUNDARY_PATH đã cấu hình nhưng thiếu shapely>=2 -> lọc địa bàn theo địa chỉ Nominatim")
+        return None
+    try:
+        _index = BoundaryIndex(_read_features(BOUNDARY_PATH))
+        print(f"[INFO] Nạp {len(_index)} polygon ranh giới từ {BOUNDARY_PATH}")
+    except Exception as e:
+        print(f"[WARN] Không nạp được ranh giới {BOUNDARY_PATH}: {e}")
+        _index = None
+    return _index
+
+
+def in_area(lat, lng, district, province):
+    """True/False theo polygon; None nếu không dùng được ranh giới cho combo này."""
+    idx = get_index()
+    if idx is None:
+        return None
+    return idx.in_area(lat, lng, district, province)
@@ -0,0 +1,187 @@
+# classifier.py
+# Phân loại cửa hàng theo tên: 'Nhà thuốc' | 'Loại trừ' | 'Khác'
+#
+# Dùng chung cho parser.categorize và bộ lọc loại trừ của pipeline:
+#   - danh sách từ khoá được chuẩn hoá (bỏ dấu, lowercase, bỏ dấu câu) 1 lần lúc import
+#   - gộp thành 1 regex dạng trie (nhánh chung tiền tố), quét tên 1 lượt
+#   - classify_many / reclassify_table để phân loại lại cả bảng grocery_stores
+#
+# Chạy: python classifier.py --reclassify [--dry-run]
+
+import argparse
+from collections import Counter
+import re
+
+from filters import _norm
+
+CAT_PHARMACY = "Nhà thuốc"
+CAT_EXCLUDED = "Loại trừ"
+CAT_OTHER = "Khác"
+
+# Từ khóa loại trừ (không thu thập): đông y / nam dược / cổ truyền / thú y
+EXCLUDE_KEYWORDS = [
+    "đông y", "nam dược", "cổ truyền", "y học cổ truyền",
+    "thuốc bắc", "thú y", "thú y viện", "pet", "veterinary", "thuốc nam",
+    "dong y", "nam duoc", "co truyen", "y hoc co truyen",
+    "thuoc bac", "thu y", "thu y vien", "thuy vien", "thuoc nam"
+]
+
+PHARMACY_KEYWORDS = [
+    # Nhà thuốc
+    "nhà thuốc", "hiệu thuốc", "quầy thuốc", "tiệm thuốc",
+    "nhà thuốc tây", "nhà thuốc tư nhân",
+    "đại lý thuốc tây", "bán lẻ thuốc",
+    "siêu thị thuốc", "quầy bán thuốc", "phòng thuốc",
+    "thuốc tây",
+
+    # Chuỗi lớn
+    "pharmacity", "long châu", "an khang", "guardian",
+    "eco", "trung sơn", "phano", "medicare",
+
+    # English
+    "pharmacy", "phamacy", "drugstore", "drug store", "chemist", "medical store",
+
+    # Thực phẩm chức năng (nhiều nhà thuốc có bán)
+    "thực phẩm chức năng", "tpcn", "cửa hàng thực phẩm chức năng",
+    "shop thực phẩm chức năng",
+    "siêu thị thực phẩm chức năng", "thực phẩm bảo vệ sức khỏe",
+    "dinh dưỡng", "bổ sung sức khỏe", "thảo dược", "sâm nhung",
+
+    # English supplements
+    "supplement", "dietary supplement", "nutraceutical",
+    "collagen", "omega", "ginseng", "herbal medicine",
+    "wellness store", "health supplement", "nutrition store"
+]
+
+
+def _trie_pattern(terms):
+    """Regex khớp bất kỳ chuỗi nào trong terms, các nhánh chung tiền tố được gộp (kiểu automaton)."""
+    trie = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and not end else "(?:" + "|".join(branches) + ")"
+        return body + "?" if end else body
+
+    return build(trie)
+
+
+def _fold_terms(terms):
+    return sorted({_norm(t) for t in terms if _norm(t)})
+
+
+# Tại mỗi vị trí thử nhóm loại trừ trước rồi mới tới nhà thuốc; lookahead (độ dài 0) để các từ khoá
+# chồng lên nhau (vd 'nha thuoc nam' chứa cả 'nha thuoc' và 'thuoc nam') đều được thấy.
+_CLASSIFY_RE = re.compile(
+    "(?=(?P<x>" + _trie_pattern(_fold_terms(EXCLUDE_KEYWORDS)) + "))"
+    "|(?=(?P<p>" + _trie_pattern(_fold_terms(PHARMACY_KEYWORDS)) + "))"
+)
+_EXCLUDE_RE = re.compile(_trie_pattern(_fold_terms(EXCLUDE_KEYWORDS)))
+
+
+def _classify_folded(folded):
+    pharmacy = False
+    for m in _CLASSIFY_RE.finditer(folded):
+        if m.group("x") is not None:
+            return CAT_EXCLUDED
+        pharmacy = True
+    return CAT_PHARMACY if pharmacy else CAT_OTHER
+
+
+def classify(name: str) -> str:
+    """Trả về: 'Nhà thuốc' | 'Loại trừ' | 'Khác'"""
+    return _classify_folded(_norm(name or ""))
+
+
+def classify_many(names):
+    """Phân loại 1 loạt tên (giữ thứ tự)."""
+    return [classify(n) for n in names]
+
+
+def contains_excluded(text: str) -> bool:
+    """Chuỗi (đã hoặc chưa chuẩn hoá) có chứa từ khoá loại trừ không."""
+    return _EXCLUDE_RE.search(_norm(text or "")) is not None
+
+
+def is_excluded_by_name_or_category(info: dict) -> bool:
+    """
+    Loại trừ nếu tên hoặc category có chứa từ khóa không mong muốn.
+    - Dùng khi parser trả category từ hàm categorize(name) hoặc để trống.
+    """
+    name = info.get("name") or ""
+    cat = info.get("category") or ""
+    # Nếu parser đã phân loại "Loại trừ" thì cũng bỏ luôn
+    if cat.strip().lower() == CAT_EXCLUDED.lower():
+        return True
+    return contains_excluded(f"{name} {cat}")
+
+
+# ========= Phân loại lại cả bảng =========
+
+def reclassify_table(cur, conn, batch_size=5000, dry_run=False):
+    """
+    Chạy lại classify trên toàn bộ grocery_stores (đọc theo keyset id), chỉ UPDATE dòng có category đổi.
+    Trả về Counter {'<cũ> -> <mới>': số dòng}.
+    """
+    import psycopg2.extras
+
+    changes = Counter()
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT id, name, category FROM grocery_stores
+            WHERE id > %s ORDER BY id LIMIT %s;
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        new_cats = classify_many(r[1] for r in rows)
+        updates = [(r[0], c) for r, c in zip(rows, new_cats) if r[2] != c]
+        for r, c in zip(rows, new_cats):
+            if r[2] != c:
+                changes[f"{r[2]} -> {c}"] += 1
+
+        if updates and not dry_run:
+            psycopg2.extras.execute_values(cur, """
+                UPDATE grocery_stores AS g SET category = v.category
+                FROM (VALUES %s) AS v (id, category)
+                WHERE g.id = v.id;
+            """, updates, page_size=1000)
+        conn.commit()
+    return changes
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Phân loại tên cửa hàng / phân loại lại grocery_stores")
+    ap.add_argument("names", nargs="*", help="tên cần phân loại thử")
+    ap.add_argument("--reclassify", action="store_true", help="phân loại lại toàn bộ grocery_stores")
+    ap.add_argument("--dry-run", action="store_true", help="chỉ đếm thay đổi, không ghi DB")
+    args = ap.parse_args()
+
+    for n in args.names:
+        print(f"{classify(n):10s} | {n}")
+
+    if args.reclassify:
+        from db import connect_postgres, release_postgres
+        conn, cur = connect_postgres()
+        try:
+            changes = reclassify_table(cur, conn, dry_run=args.dry_run)
+        finally:
+            release_postgres(conn, cur)
+        print(f"[INFO] {sum(changes.values())} dòng đổi category{' (dry-run)' if args.dry_run else ''}")
+        for k, v in changes.most_common():
+            print(f"   {v:7d}  {k}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@
 
 # ====== Postgres ======
 PG_DSN = "host=localhost port=5432 dbname=gisdb user=postgres password=12345"
+PG_POOL_MIN = 1                  # kết nối mở sẵn mỗi tiến trình
+PG_POOL_MAX = 8                  # tối đa mỗi tiến trình (scraper dùng ~4: browse, pipeline, giữ lease, cache geocode)
+PG_POOL_WAIT_SECONDS = 30        # chờ tối đa khi pool đã cho mượn hết
+PG_STATEMENT_TIMEOUT_MS = 60000  # mặc định cho mọi câu lệnh (0 = không giới hạn)
+PG_LOCK_TIMEOUT_MS = 10000       # chờ khoá tối đa
+MIGRATE_ON_STARTUP = True        # False: schema cũ thì dừng, bắt chạy tay `python migrations.py`
 
 # ====== Selenium ======
 SELENIUM_HEADLESS = False          # True nếu chạy server
@@ -12,6 +18,41 @@ SELENIUM_USER_AGENT = (
     "(KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"
 )
 
+# Chrome "gọn" cho scrape list: chỉ cần DOM của feed → chặn ảnh, tile bản đồ, font, media qua CDP
+# (Network.setBlockedURLs). Thuộc tính img src trong DOM không đổi nên parser vẫn lấy được URL ảnh.
+SELENIUM_LEAN = True
+SELENIUM_BLOCK_URLS = [
+    # tile bản đồ (raster/vector, vệ tinh) + Street View
+    "*://www.google.com/maps/vt*", "*://maps.google.com/maps/vt*", "*://khms*.google.com/kh*",
+    "*://streetviewpixels-pa.googleapis.com/*", "*://geo*.ggpht.com/*",
+    # ảnh
+    "*://lh*.googleusercontent.com/*", "*://*.ggpht.com/*",
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico",
+    # font, media
+    "*://fonts.gstatic.com/*", "*.woff", "*.woff2", "*.ttf",
+    "*.mp4", "*.webm", "*.mp3",
+]
+SELENIUM_WINDOW_SIZE = "1280,900"   # viewport nhỏ hơn → ít tile/ít vẽ lại
+SELENIUM_DISABLE_WEBGL = False      # True: tắt WebGL (bớt CPU/GPU) nhưng Maps có thể chuyển sang chế độ lite, DOM khác
+
+# ====== Song song ======
+SCRAPER_WORKERS = 1              # mặc định chạy tuần tự; ghi đè bằng --workers N
+WORKER_START_STAGGER = 3         # giây, giãn thời điểm mở Chrome giữa các worker
+
+# ====== Crawl phân tán (lease trên crawl_progress) ======
+LEASE_SECONDS = 900              # worker giữ combo tối đa 15 phút nếu không heartbeat
+LEASE_MAX_ATTEMPTS = 5           # combo bị claim quá số lần này thì bỏ qua (cần xem tay)
+HEARTBEAT_SECONDS = LEASE_SECONDS // 3   # gia hạn lease của task đang chạy sau mỗi N giây (theo thời gian, không theo card)
+CHECKPOINT_EVERY_CARDS = 20      # ghi crawl_progress.last_place_id sau mỗi N card đã lưu bền
+
+# ====== Pipeline browse → parse → geocode → persist ======
+PIPELINE_PAGE_QUEUE = 2          # số trang kết quả chờ parse (browser bị chặn khi đầy)
+PIPELINE_CARD_QUEUE = 500        # số card chờ geocode / chờ lưu
+STORE_WRITER_BATCH = 200         # ghi grocery_stores theo lô: tối đa N dòng ...
+STORE_WRITER_FLUSH_SECONDS = 5   # ... hoặc sau T giây, và luôn flush khi hết 1 combo
+STORE_WRITE_MODE = "changed"     # 'changed': chỉ ghi dòng có content_hash khác | 'full': ghi đè như cũ
+LAST_SEEN_BUMP_HOURS = 24        # dòng không đổi: cập nhật last_seen_at tối đa 1 lần / N giờ
+
 # ====== Crawl phạm vi ======
 PROVINCE_DISTRICTS = {
   "Thành phố Hà Nội": [
@@ -861,8 +902,48 @@ KEYWORDS = build_keywords()
 SCROLL_PATIENCE = 4
 SCROLL_MAX_ROUNDS = 120
 SCROLL_WAIT_ITEM = 15     # giây chờ có ít nhất 1 item đầu tiên
-SCROLL_GAP_MINMAX = (0.8, 1.2)  # sleep ngẫu nhiên mỗi vòng cuộn
+SCROLL_GAP_MINMAX = (0.4, 0.8)  # giãn cách tối thiểu (ngẫu nhiên) giữa 2 lần cuộn, tính từ lần cuộn trước
+SCROLL_ROUND_TIMEOUT = 3        # giây tối đa chờ card mới sau mỗi lần cuộn
+SCROLL_NET_IDLE_MS = 800        # ... hoặc dừng chờ sớm khi trang không nhận thêm dữ liệu trong N ms
+SCROLL_SUBMIT_EVERY_CARDS = 20  # trong lúc cuộn, cứ tải thêm N card thì đẩy vào pipeline (không chờ cuộn xong)
+CARD_EXTRACTOR = "json"          # "json": JS lấy sẵn các trường trong trang | "html": outerHTML + parse phía Python
+                                 # | "network": giải mã response XHR tìm kiếm (có địa chỉ đầy đủ, bỏ qua Nominatim)
+PARSER_BACKEND = "auto"          # parse HTML card: "auto" | "selectolax" | "lxml" | "bs4" (chưa cài thì về bs4)
+
+# ====== Điều hướng tới kết quả tìm kiếm ======
+NAV_MODE = "inpage"          # "inpage": gõ vào ô tìm kiếm của Maps đang mở | "url": mở thẳng URL tìm kiếm | "homepage": cách cũ
+NAV_SEARCHBOX_TIMEOUT = 15   # giây chờ ô tìm kiếm (chế độ homepage)
+NAV_STALE_TIMEOUT = 10       # giây chờ feed cũ bị thay sau khi tìm trong trang; quá thì mở URL tìm kiếm
+SEARCH_READY_TIMEOUT = 20    # giây chờ có feed / CAPTCHA sau khi tìm (thay cho ngủ cố định 5–8s)
+WAIT_POLL_SECONDS = 0.25     # chu kỳ hỏi trạng thái trang khi chờ
+
+# ====== Chính sách lịch sự (nhịp truy vấn mỗi Chrome) ======
+POLITE_SEARCH_INTERVAL = 10  # giây tối thiểu giữa 2 lần tìm (tính từ lần tìm trước, thay cho ngủ 5–10s sau mỗi task)
+POLITE_JITTER = 0.3          # ±30% ngẫu nhiên quanh giãn cách
+POLITE_CAPTCHA_BACKOFF = 2   # gặp CAPTCHA: nhân giãn cách tìm kiếm lên
+POLITE_BACKOFF_MAX = 8       # ... tối đa x8, tìm trơn tru thì giảm dần về x1
 
 # ====== Reverse Geocoding (OSM/Nominatim) ======
 OSM_USER_AGENT = "poi-coverage-scraper/1.0 (contact: your_email@example.com)"
 OSM_RATE_LIMIT_SLEEP = 1.1   # giây
+
+# Cache reverse geocode bền qua các lần chạy: "postgres" (bảng geocode_cache, dùng chung mọi worker/máy),
+# "sqlite" (file cục bộ, chạy 1 máy) hoặc None (chỉ cache RAM như cũ)
+GEOCODE_CACHE_BACKEND = "postgres"
+GEOCODE_CACHE_SQLITE_PATH = "geocode_cache.sqlite3"
+GEOCODE_CACHE_TTL_DAYS = 180
+GEOCODE_CACHE_PRECISION = 6  # số chữ số thập phân khi làm tròn lat/lng làm khoá
+GEOCODE_WARM_FROM_STORES = True  # nạp sẵn địa chỉ đã có trong grocery_stores khi khởi động
+
+# ====== Ranh giới hành chính (lọc địa bàn offline, cần shapely>=2) ======
+# GeoJSON cấp huyện (vd GADM gadm41_VNM_2.json) hoặc .shp (cần pyshp). None = lọc theo địa chỉ Nominatim như cũ.
+BOUNDARY_PATH = None
+BOUNDARY_PROVINCE_PROP = "NAME_1"   # thuộc tính tên tỉnh trong feature
+BOUNDARY_DISTRICT_PROP = "NAME_2"   # thuộc tính tên huyện trong feature
+
+# Lọc thô bằng bounding box trước khi geocode (hộp từ ranh giới hoặc từ toạ độ đã lưu)
+BBOX_MARGIN_DEG = 0.05   # ~5 km lề quanh hộp dựng từ ranh giới
+BBOX_MIN_POINTS = 5      # huyện cần ít nhất N cửa hàng đã lưu mới dựng hộp từ grocery_stores
+# ~11 km lề quanh hộp dựng từ cửa hàng đã lưu; card ngoài hộp này bị loại dù có thể vẫn thuộc huyện
+# (vùng chưa có cửa hàng nào) hoặc thuộc huyện khác cùng tỉnh → tăng lên nếu thấy mất card, 0 lề quá hẹp
+BBOX_STORE_MARGIN_DEG = 0.1
@@ -1,14 +1,21 @@
 # db.py
-# Kết nối DB, tạo/migrate bảng, lưu dữ liệu cửa hàng (có geometry)
+# Kết nối DB, kiểm tra schema (migration ở migrations.py), lưu dữ liệu cửa hàng (có geometry)
 
+import time
 import psycopg2
 import psycopg2.extras
-from config import PG_DSN
+import dbpool
+from config import (
+    STORE_WRITER_BATCH, STORE_WRITER_FLUSH_SECONDS, STORE_WRITE_MODE, LAST_SEEN_BUMP_HOURS,
+    MIGRATE_ON_STARTUP,
+)
 
 def connect_postgres():
-    conn = psycopg2.connect(PG_DSN)
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    return conn, cur
+    """Mượn 1 kết nối từ pool (dbpool.py) + DictCursor. Trả lại bằng release_postgres()."""
+    return dbpool.connect()
+
+def release_postgres(conn, cur=None):
+    dbpool.close(conn, cur)
 
 def ensure_postgis(cur):
     """Bật PostGIS (nếu role hiện tại có quyền). Không fatal nếu không có quyền."""
@@ -20,97 +27,20 @@ def ensure_postgis(cur):
 
 def ensure_tables(cur, conn):
     """
-    - Tạo bảng nếu chưa có
-    - Bổ sung cột/ chỉ mục còn thiếu
-    - Tạo trigger tự động set geom từ lat/lon
+    Kiểm tra phiên bản schema (1 câu SELECT trên schema_version).
+    - Đã mới nhất: không chạy DDL nào
+    - Cũ hơn: áp migration còn thiếu nếu MIGRATE_ON_STARTUP, ngược lại báo lỗi
+      (chạy tay: python migrations.py)
     """
-    ensure_postgis(cur)
-
-    # Bảng dữ liệu cửa hàng
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS grocery_stores (
-            id SERIAL PRIMARY KEY,
-            province TEXT,
-            district TEXT,
-            place_id TEXT UNIQUE,
-            name TEXT,
-            image TEXT,
-            rating TEXT,
-            category TEXT,
-            status TEXT,
-            closing_time TEXT,
-            phone TEXT,
-            latitude DOUBLE PRECISION,
-            longitude DOUBLE PRECISION,
-            address TEXT,
-            map_url TEXT,
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-
-    # Thêm cột geom nếu chưa có (Point, WGS84)
-    cur.execute("""
-        DO $$
-        BEGIN
-            IF NOT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name='grocery_stores' AND column_name='geom'
-            ) THEN
-                EXECUTE 'ALTER TABLE grocery_stores ADD COLUMN geom geometry(Point,4326)';
-            END IF;
-        END$$;
-    """)
-
-    # Bảng tiến trình
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS crawl_progress (
-            province TEXT NOT NULL,
-            district TEXT NOT NULL,
-            keyword  TEXT NOT NULL,
-            status   TEXT NOT NULL DEFAULT 'pending',   -- pending|running|partial|done|failed
-            last_place_id TEXT,
-            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
-            CONSTRAINT crawl_progress_pk PRIMARY KEY (province, district, keyword)
-        );
-    """)
-
-    # Migrate phòng khi bảng cũ thiếu cột
-    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS address TEXT;")
-    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS map_url TEXT;")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_province ON grocery_stores (province);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_district ON grocery_stores (district);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_latlng ON grocery_stores (latitude, longitude);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_geom ON grocery_stores USING GIST (geom);")
-
-    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS last_place_id TEXT;")
-    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'pending';")
-    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW();")
-
-    # Trigger: tự động set geom khi có lat/lon
-    cur.execute("""
-        CREATE OR REPLACE FUNCTION set_geom_from_latlon()
-        RETURNS trigger AS $$
-        BEGIN
-          IF NEW.longitude IS NOT NULL AND NEW.latitude IS NOT NULL THEN
-            NEW.geom := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326);
-          ELSE
-            NEW.geom := NULL;
-          END IF;
-          RETURN NEW;
-        END;
-        $$ LANGUAGE plpgsql;
-    """)
+    from migrations import current_version, migrate, LATEST_VERSION
 
-    cur.execute("DROP TRIGGER IF EXISTS trg_set_geom ON grocery_stores;")
-    cur.execute("""
-        CREATE TRIGGER trg_set_geom
-        BEFORE INSERT OR UPDATE OF latitude, longitude
-        ON grocery_stores
-        FOR EACH ROW
-        EXECUTE FUNCTION set_geom_from_latlon();
-    """)
-
-    conn.commit()
+    version = current_version(cur, conn)
+    if version >= LATEST_VERSION:
+        return
+    if not MIGRATE_ON_STARTUP:
+        raise RuntimeError(f"Schema ở phiên bản {version} < {LATEST_VERSION}; chạy: python migrations.py")
+    print(f"[INFO] Schema phiên bản {version} -> {LATEST_VERSION}, đang migrate...")
+    migrate(cur, conn)
 
 def backfill_geom(cur, conn):
     """
@@ -133,22 +63,105 @@ def is_duplicate(cur, place_id):
     cur.execute("SELECT * FROM grocery_stores WHERE place_id = %s;", (place_id,))
     return cur.fetchone()
 
+# ========= Lưu cửa hàng =========
+#
+# STORE_WRITE_MODE:
+#   'changed' (mặc định): chỉ UPDATE khi content_hash khác; created_at giữ là lần thấy đầu tiên;
+#             dòng không đổi chỉ được bump last_seen_at (tối đa 1 lần / LAST_SEEN_BUMP_HOURS, HOT update
+#             vì không cột nào có index) → recrawl không sinh dead tuple / WAL / cập nhật GIST.
+#   'full'   : ghi đè toàn bộ như trước.
+# geom luôn do trigger trg_set_geom tính, không tính lại trong SQL.
+
+STORE_COLUMNS = (
+    "province", "district", "place_id", "name", "image", "rating", "category",
+    "status", "closing_time", "phone", "latitude", "longitude",
+    "address", "map_url", "created_at",
+    "rating_value", "review_count", "phone_e164", "open_status",
+)
+# kiểu cột khác TEXT (ép kiểu tham số / bảng staging cho khớp, để md5(ROW(...)) giống nhau mọi nơi)
+_COLUMN_TYPES = {
+    "latitude": "double precision", "longitude": "double precision", "created_at": "timestamp",
+    "rating_value": "numeric(2,1)", "review_count": "integer", "open_status": "store_open_status",
+}
+# các cột tạo nên nội dung (bỏ place_id là khoá, created_at là mốc thời gian)
+_CONTENT_COLUMNS = [c for c in STORE_COLUMNS if c not in ("place_id", "created_at")]
+
+def content_hash_sql(col_expr):
+    """
+    Biểu thức SQL md5 trên nội dung 1 dòng. col_expr(c) trả về biểu thức cho cột c,
+    vd lambda c: f"EXCLUDED.{c}". Cùng 1 công thức cho mọi nơi ghi để hash so sánh được.
+    """
+    return "md5(ROW(" + ", ".join(col_expr(c) for c in _CONTENT_COLUMNS) + ")::text)"
+
+def backfill_content_hash(cur, conn=None):
+    """
+    Điền content_hash cho dòng chưa có (migration 006 và cuối normalize.py --backfill; sau đó các lần ghi
+    tự giữ hash) → lần crawl lại đầu tiên không ghi lại cả bảng. conn=None: không commit (trong migration).
+    """
+    cur.execute(f"""
+        UPDATE grocery_stores
+        SET content_hash = {content_hash_sql(lambda c: c)}
+        WHERE content_hash IS NULL;
+    """)
+    if conn is not None:
+        conn.commit()
+    return cur.rowcount
+
+def _bump_last_seen_sql(source):
+    """Bump last_seen_at cho các place_id trong source (alias s), tối đa 1 lần / LAST_SEEN_BUMP_HOURS."""
+    return f"""
+        UPDATE grocery_stores AS g
+        SET last_seen_at = NOW()
+        FROM {source}
+        WHERE g.place_id = s.place_id
+          AND (g.last_seen_at IS NULL OR g.last_seen_at < NOW() - make_interval(hours => {int(LAST_SEEN_BUMP_HOURS)}));
+    """
+
+def _typed_params_sql():
+    """SELECT 1 dòng từ tham số, ép đúng kiểu cột (để md5(ROW(...)) trùng với hash của bảng staging)."""
+    return "SELECT " + ", ".join(f"%({c})s::{_COLUMN_TYPES.get(c, 'text')} AS {c}" for c in STORE_COLUMNS)
+
 def save_store(cur, conn, store_data):
     """
-    Lưu 1 record vào grocery_stores, chống trùng theo place_id.
-    - Insert kèm geom (nếu có lat/lon)
-    - Nếu trùng, cập nhật lại các trường và geom (upsert)
+    Lưu 1 record vào grocery_stores, chống trùng theo place_id (upsert).
     Trả về True nếu insert mới hoặc update, False nếu không thay đổi.
     """
+    if STORE_WRITE_MODE == "full":
+        return _save_store_full(cur, conn, store_data)
+
+    cols = ", ".join(STORE_COLUMNS)
+    set_list = ", ".join(f"{c} = EXCLUDED.{c}" for c in _CONTENT_COLUMNS)
+    new_hash = content_hash_sql(lambda c: f"EXCLUDED.{c}")
+    dbpool.execute_prepared(cur, "gs_save_store", f"""
+        INSERT INTO grocery_stores AS g ({cols}, content_hash, last_seen_at)
+        SELECT {cols}, {content_hash_sql(lambda c: f"s.{c}")}, NOW()
+        FROM ({_typed_params_sql()}) AS s
+        ON CONFLICT (place_id) DO UPDATE
+        SET {set_list},
+            content_hash = {new_hash},
+            last_seen_at = NOW()
+        WHERE g.content_hash IS DISTINCT FROM {new_hash};
+    """, store_data)
+    changed = cur.rowcount > 0
+    if not changed:
+        dbpool.execute_prepared(cur, "gs_bump_seen", _bump_last_seen_sql("(SELECT %s::text AS place_id) AS s"),
+                                (store_data["place_id"],))
+    conn.commit()
+    return changed
+
+def _save_store_full(cur, conn, store_data):
+    """Chế độ 'full' (cách cũ): luôn ghi đè mọi cột, kể cả created_at và geom."""
     cur.execute("""
         INSERT INTO grocery_stores (
             province, district, place_id, name, image, rating, category,
             status, closing_time, phone, latitude, longitude,
-            address, map_url, created_at, geom
+            address, map_url, created_at,
+            rating_value, review_count, phone_e164, open_status, geom
         ) VALUES (
             %(province)s, %(district)s, %(place_id)s, %(name)s, %(image)s, %(rating)s, %(category)s,
             %(status)s, %(closing_time)s, %(phone)s, %(latitude)s, %(longitude)s,
             %(address)s, %(map_url)s, %(created_at)s,
+            %(rating_value)s, %(review_count)s, %(phone_e164)s, %(open_status)s::store_open_status,
             CASE
               WHEN %(longitude)s IS NOT NULL AND %(latitude)s IS NOT NULL
               THEN ST_SetSRID(ST_MakePoint(%(longitude)s, %(latitude)s), 4326)
@@ -171,6 +184,10 @@ def save_store(cur, conn, store_data):
           address      = EXCLUDED.address,
           map_url      = EXCLUDED.map_url,
           created_at   = EXCLUDED.created_at,
+          rating_value = EXCLUDED.rating_value,
+          review_count = EXCLUDED.review_count,
+          phone_e164   = EXCLUDED.phone_e164,
+          open_status  = EXCLUDED.open_status,
           geom = CASE
             WHEN EXCLUDED.longitude IS NOT NULL AND EXCLUDED.latitude IS NOT NULL
             THEN ST_SetSRID(ST_MakePoint(EXCLUDED.longitude, EXCLUDED.latitude), 4326)
@@ -179,3 +196,167 @@ def save_store(cur, conn, store_data):
     """, store_data)
     conn.commit()
     return cur.rowcount > 0
+
+def load_district_cards(cur, province, district, fields):
+    """place_id -> tuple(fields) của các cửa hàng đã lưu cho 1 (tỉnh, huyện)."""
+    cols = ", ".join(fields)
+    cur.execute(f"""
+        SELECT place_id, {cols}
+        FROM grocery_stores
+        WHERE province = %s AND district = %s AND place_id IS NOT NULL;
+    """, (province, district))
+    rows = cur.fetchall()
+    cur.connection.commit()
+    return {r[0]: tuple(r[1:]) for r in rows}
+
+_REFRESH_FIELDS = (
+    "name", "image", "rating", "category", "status", "closing_time", "phone", "map_url",
+    "rating_value", "review_count", "phone_e164", "open_status",
+)
+
+def refresh_store_fields(cur, conn, rows):
+    """
+    Cập nhật theo lô các trường lấy từ card (không đụng toạ độ/địa chỉ/created_at) cho các place_id
+    đã có. Chỉ ghi dòng thực sự khác. Trả về số dòng đã cập nhật.
+    """
+    if not rows:
+        return 0
+    updated = psycopg2.extras.execute_values(cur, f"""
+        UPDATE grocery_stores AS g
+        SET name = v.name,
+            image = v.image,
+            rating = v.rating,
+            category = v.category,
+            status = v.status,
+            closing_time = v.closing_time,
+            phone = v.phone,
+            map_url = v.map_url,
+            rating_value = v.rating_value,
+            review_count = v.review_count,
+            phone_e164 = v.phone_e164,
+            open_status = v.open_status,
+            content_hash = {content_hash_sql(lambda c: f"v.{c}" if c in _REFRESH_FIELDS else f"g.{c}")},
+            last_seen_at = NOW()
+        FROM (VALUES %s) AS v (place_id, {", ".join(_REFRESH_FIELDS)})
+        WHERE g.place_id = v.place_id
+          AND ({", ".join(f"g.{c}" for c in _REFRESH_FIELDS)})
+              IS DISTINCT FROM
+              ({", ".join(f"v.{c}" for c in _REFRESH_FIELDS)})
+        RETURNING 1;
+    """, rows, template="(%(place_id)s, " + ", ".join(
+        f"%({c})s::{_COLUMN_TYPES[c]}" if c in _COLUMN_TYPES else f"%({c})s" for c in _REFRESH_FIELDS
+    ) + ")", page_size=500, fetch=True)
+    conn.commit()
+    return len(updated)
+
+# ========= Ghi theo lô =========
+
+class StoreWriter:
+    """
+    Gom bản ghi cửa hàng trong bộ nhớ rồi ghi 1 lần: execute_values vào bảng tạm (staging)
+    + 1 câu INSERT ... SELECT ... ON CONFLICT set-based, 1 commit cho cả lô.
+    Ghi theo STORE_WRITE_MODE (xem đầu mục "Lưu cửa hàng").
+
+    flush() trả về {'inserted', 'updated', 'unchanged'}; các bản ghi của lô vừa commit nằm ở `flushed`.
+    """
+
+    def __init__(self, cur, conn, batch_size=STORE_WRITER_BATCH, flush_seconds=STORE_WRITER_FLUSH_SECONDS,
+                 mode=STORE_WRITE_MODE):
+        self.cur = cur
+        self.conn = conn
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.mode = mode
+        self._rows = {}          # place_id -> row (trùng trong lô thì giữ bản mới nhất)
+        self._first_at = None
+        self._staging_ready = False
+        self.flushed = []        # bản ghi của lần flush thành công gần nhất
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, store_data):
+        """Thêm 1 bản ghi; trả về True nếu lô đã đủ batch_size (nên flush)."""
+        if not self._rows:
+            self._first_at = time.monotonic()
+        self._rows[store_data["place_id"]] = store_data
+        return len(self._rows) >= self.batch_size
+
+    def due(self):
+        """Lô đang chờ quá flush_seconds."""
+        return bool(self._rows) and time.monotonic() - self._first_at >= self.flush_seconds
+
+    def _ensure_staging(self):
+        if self._staging_ready:
+            return
+        self.cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS stage_grocery_stores (
+                province TEXT, district TEXT, place_id TEXT, name TEXT, image TEXT, rating TEXT,
+                category TEXT, status TEXT, closing_time TEXT, phone TEXT,
+                latitude DOUBLE PRECISION, longitude DOUBLE PRECISION,
+                address TEXT, map_url TEXT, created_at TIMESTAMP,
+                rating_value NUMERIC(2,1), review_count INTEGER, phone_e164 TEXT, open_status store_open_status
+            ) ON COMMIT DELETE ROWS;
+        """)
+        self._staging_ready = True
+
+    def _upsert_sql(self):
+        cols = ", ".join(STORE_COLUMNS)
+        if self.mode == "full":
+            set_list = ", ".join(f"{c} = EXCLUDED.{c}" for c in _CONTENT_COLUMNS + ["created_at"])
+            return f"""
+                INSERT INTO grocery_stores AS g ({cols})
+                SELECT {cols} FROM stage_grocery_stores
+                ON CONFLICT (place_id) DO UPDATE
+                SET {set_list}
+                RETURNING (g.xmax = 0) AS inserted;
+            """
+        set_list = ", ".join(f"{c} = EXCLUDED.{c}" for c in _CONTENT_COLUMNS)
+        new_hash = content_hash_sql(lambda c: f"EXCLUDED.{c}")
+        return f"""
+            INSERT INTO grocery_stores AS g ({cols}, content_hash, last_seen_at)
+            SELECT {cols}, {content_hash_sql(lambda c: f"s.{c}")}, NOW()
+            FROM stage_grocery_stores AS s
+            ON CONFLICT (place_id) DO UPDATE
+            SET {set_list},
+                content_hash = {new_hash},
+                last_seen_at = NOW()
+            WHERE g.content_hash IS DISTINCT FROM {new_hash}
+            RETURNING (g.xmax = 0) AS inserted;
+        """
+
+    def flush(self):
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        self.flushed = []
+        if not self._rows:
+            return counts
+        rows = list(self._rows.values())
+        cols = ", ".join(STORE_COLUMNS)
+        try:
+            self._ensure_staging()
+            psycopg2.extras.execute_values(
+                self.cur,
+                f"INSERT INTO stage_grocery_stores ({cols}) VALUES %s;",
+                rows,
+                template="(" + ", ".join(f"%({c})s" for c in STORE_COLUMNS) + ")",
+                page_size=1000,
+            )
+            dbpool.execute_prepared(self.cur, f"gs_stage_upsert_{self.mode}", self._upsert_sql())
+            written = self.cur.fetchall()
+            if self.mode != "full" and len(written) < len(rows):
+                # dòng không đổi: chỉ bump last_seen_at (dòng vừa ghi đã có last_seen_at = NOW() nên tự bị bỏ qua)
+                dbpool.execute_prepared(self.cur, "gs_stage_bump_seen", _bump_last_seen_sql("stage_grocery_stores AS s"))
+            self.conn.commit()
+            self.flushed = rows
+        except Exception:
+            self.conn.rollback()
+            self._staging_ready = False   # bảng tạm có thể chưa kịp tạo trong transaction lỗi
+            raise
+        finally:
+            self._rows = {}
+            self._first_at = None
+
+        counts["inserted"] = sum(1 for r in written if r[-1])
+        counts["updated"] = len(written) - counts["inserted"]
+        counts["unchanged"] = len(rows) - len(written)
+        return counts
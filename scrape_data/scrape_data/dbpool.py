@@ -0,0 +1,192 @@
+# dbpool.py
+# Lớp truy cập Postgres dùng chung cho scraper, backfill, classifier, migrations và tool lấy ảnh (testimages/).
+#
+# - 1 ThreadedConnectionPool mỗi tiến trình (tạo lười, tạo lại sau fork), giới hạn PG_POOL_MAX kết nối;
+#   hết kết nối thì chờ thay vì lỗi ngay
+# - DSN: DATABASE_URL → biến PG* (PGDATABASE, PGHOST, ... do libpq tự đọc) → config.PG_DSN
+# - statement_timeout / lock_timeout đặt sẵn lúc mở kết nối (không tốn thêm round-trip);
+#   statement_timeout(cur, ms) để nới/siết cho 1 transaction
+# - execute_prepared(): PREPARE 1 lần mỗi kết nối rồi EXECUTE cho các câu upsert nóng
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+from config import PG_DSN, PG_POOL_MIN, PG_POOL_MAX, PG_POOL_WAIT_SECONDS, PG_STATEMENT_TIMEOUT_MS, PG_LOCK_TIMEOUT_MS
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Kết nối nhớ các prepared statement đã tạo: tên → thứ tự tham số."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = {}
+        self.session_dirty = False
+        self._dbpool_slots = None
+
+
+def resolve_dsn():
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+    if os.getenv("PGDATABASE"):
+        return ""   # libpq tự lấy PGHOST/PGPORT/PGDATABASE/PGUSER/PGPASSWORD
+    return PG_DSN
+
+
+def _options():
+    return f"-c statement_timeout={int(PG_STATEMENT_TIMEOUT_MS)} -c lock_timeout={int(PG_LOCK_TIMEOUT_MS)}"
+
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+_orphans = []   # pool kế thừa từ tiến trình cha: giữ tham chiếu, KHÔNG đóng (socket dùng chung với cha)
+
+
+def get_pool():
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if _pool is not None:
+                _orphans.append(_pool)
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                PG_POOL_MIN, PG_POOL_MAX, resolve_dsn(),
+                connection_factory=PooledConnection, options=_options(),
+            )
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(PG_POOL_MAX)
+        return _pool
+
+
+def acquire(timeout=PG_POOL_WAIT_SECONDS):
+    """Mượn 1 kết nối (chờ tối đa timeout giây nếu pool đang dùng hết)."""
+    pool = get_pool()
+    slots = _slots
+    if not slots.acquire(timeout=timeout):
+        raise psycopg2.pool.PoolError(f"Hết kết nối trong pool (PG_POOL_MAX={PG_POOL_MAX}) sau {timeout}s")
+    try:
+        conn = pool.getconn()
+    except Exception:
+        slots.release()
+        raise
+    conn._dbpool_slots = slots
+    return conn
+
+
+def release(conn):
+    """Trả kết nối về pool: rollback transaction dở, reset SET của phiên; kết nối hỏng thì bỏ."""
+    pool, slots = _pool, getattr(conn, "_dbpool_slots", None)
+    if slots is None or pool is None or _pool_pid != os.getpid():
+        conn.close()
+        return
+    discard = bool(conn.closed)
+    if not discard:
+        try:
+            conn.rollback()
+            if conn.session_dirty:
+                conn.autocommit = True
+                with conn.cursor() as c:
+                    c.execute("RESET ALL;")
+                conn.session_dirty = False
+            conn.autocommit = False
+            conn.cursor_factory = None
+        except psycopg2.Error:
+            discard = True
+    try:
+        pool.putconn(conn, close=discard)
+    finally:
+        conn._dbpool_slots = None
+        slots.release()
+
+
+@contextmanager
+def connection(timeout=PG_POOL_WAIT_SECONDS):
+    conn = acquire(timeout)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+def connect():
+    """(conn, cur) kiểu DictCursor như db.connect_postgres cũ, nhưng mượn từ pool. Trả lại bằng close()."""
+    conn = acquire()
+    return conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+
+def close(conn, cur=None):
+    if cur is not None and not cur.closed:
+        cur.close()
+    release(conn)
+
+
+def set_session(conn, **params):
+    """SET cấp phiên (vd lock_timeout='1s'); tự RESET ALL khi kết nối về pool."""
+    with conn.cursor() as c:
+        for k, v in params.items():
+            c.execute(f"SET {k} TO %s;", (str(v),))
+    if hasattr(conn, "session_dirty"):
+        conn.session_dirty = True
+    if not conn.autocommit:
+        conn.commit()
+
+
+def statement_timeout(cur, ms):
+    """Đổi statement_timeout cho transaction hiện tại (0 = không giới hạn), hết hiệu lực khi commit/rollback."""
+    cur.execute("SET LOCAL statement_timeout = %s;", (int(ms),))
+
+
+# ========= Prepared statement =========
+
+_PARAM_RE = re.compile(r"%\((\w+)\)s|%s")
+
+
+def _to_positional(sql):
+    """'%s' / '%(name)s' → $1..$n. Trả về (sql mới, list khoá lấy tham số: int hoặc tên)."""
+    order, named = [], {}
+
+    def sub(m):
+        name = m.group(1)
+        if name is None:
+            order.append(len(order))
+            return f"${len(order)}"
+        if name not in named:
+            order.append(name)
+            named[name] = len(order)
+        return f"${named[name]}"
+
+    return _PARAM_RE.sub(sub, sql), order
+
+
+def execute_prepared(cur, name, sql, params=()):
+    """
+    Chạy sql như cur.execute(sql, params) nhưng qua PREPARE/EXECUTE: parse + plan 1 lần mỗi kết nối.
+    Kết nối không lấy từ pool (không có .prepared) thì chạy thẳng.
+    """
+    prepared = getattr(cur.connection, "prepared", None)
+    if prepared is None:
+        cur.execute(sql, params)
+        return
+    keys = prepared.get(name)
+    if keys is None:
+        body, keys = _to_positional(sql)
+        cur.execute(f"PREPARE {name} AS {body}")
+        prepared[name] = keys
+    if not keys:
+        cur.execute(f"EXECUTE {name};")
+        return
+    args = [params[k] for k in keys]
+    try:
+        cur.execute(f"EXECUTE {name} (" + ", ".join(["%s"] * len(args)) + ");", args)
+    except psycopg2.errors.InvalidSqlStatementName:
+        prepared.pop(name, None)   # phiên đã bị DISCARD/DEALLOCATE bên ngoài: lần sau PREPARE lại
+        raise
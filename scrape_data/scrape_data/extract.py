@@ -0,0 +1,151 @@
+# extract.py
+# Lấy card từ feed Google Maps đang mở theo kiểu stream: mỗi lần gọi chỉ trả các card mới xuất hiện.
+#
+# - JS đánh dấu card đã lấy (data-scr-seen) → mỗi vòng cuộn chỉ đụng tới phần DOM mới,
+#   không còn driver.page_source cả trang ở cuối
+# - card nhận diện theo place_id (lấy từ href như parser.py) → Maps render lại / chèn lại card cũ
+#   thì không bị đẩy vào pipeline 2 lần
+# - card chưa có href (chưa render xong) để dành vòng sau; đợt cuối (final) lấy hết
+# - 2 kiểu lấy (config.CARD_EXTRACTOR):
+#     "json": JS đọc sẵn text thô từng trường ngay trong trang (1 execute_script), Python chỉ strip/regex
+#             qua parser.build_card → không serialize HTML, không BeautifulSoup
+#     "html": trả outerHTML, stage parse tách card bằng parser.split_cards (backend theo PARSER_BACKEND)
+#   Cả 2 ra cùng 1 dict (parser.build_card), dùng thay nhau được.
+# - "network": NetworkCardStream — card lấy từ response XHR tìm kiếm (netcapture.py, có thêm địa chỉ đầy đủ),
+#             card trong feed mà response không có / không giải mã được thì lấy từ DOM như "json"
+
+from parser import build_card, parse_href
+from netcapture import SearchCapture
+
+# Bộ chọn giống hệt parser.parse_business_card; trả text thô (textContent / getAttribute), strip để Python làm
+_CARD_FIELDS_JS = """
+function cardFields(card) {
+  const txt = el => el ? el.textContent : null;
+  const a = card.querySelector('a.hfpxzc[href]');
+  const img = card.querySelector('img');
+  const info = card.querySelectorAll('div.W4Efsd');
+  let status = null, closing = null, phone = null;
+  if (info.length > 1) {
+    const spans = Array.from(info[1].querySelectorAll('span'));
+    status = spans.find(s => {
+      const st = s.getAttribute('style');
+      return st && (st.includes('rgba(25,134,57') || st.includes('rgba(217,48,37'));
+    }) || null;
+    closing = spans.find(s => s.getAttribute('style') === 'font-weight: 400;') || null;
+    phone = info[1].querySelector('span.UsdlK');
+  }
+  return {
+    name: txt(card.querySelector('div.qBF1Pd')),
+    href: a ? a.getAttribute('href') : null,
+    image: img ? img.getAttribute('src') : null,
+    rating: txt(card.querySelector('span.MW4etd')),
+    reviews: txt(card.querySelector('span.UY7F9')),
+    status: txt(status),
+    closing_time: txt(closing),
+    phone: txt(phone),
+  };
+}
+"""
+
+# trả về [[place_id | null, payload], ...] theo thứ tự feed, chỉ các card chưa đánh dấu
+_NEW_CARDS_JS = _CARD_FIELDS_JS + """
+const final = arguments[0], asJson = arguments[1];
+const out = [];
+for (const card of document.querySelectorAll('div.Nv2PK:not([data-scr-seen])')) {
+  const a = card.querySelector('a.hfpxzc[href]');
+  const href = a ? a.getAttribute('href') : '';
+  const m = href.match(/!19s([^!?]+)/) || href.match(/data=[^!]+!1s([^!&]+)/);
+  if (!m && !final) continue;
+  card.setAttribute('data-scr-seen', '1');
+  out.push([m ? m[1] : null, asJson ? cardFields(card) : card.outerHTML]);
+}
+return out;
+"""
+
+EXTRACT_JSON = "json"
+EXTRACT_HTML = "html"
+EXTRACT_NETWORK = "network"
+
+
+def card_from_json(raw):
+    """Dict từ cardFields (JS) hoặc netcapture.place_fields → cùng dạng với parser.parse_business_card."""
+    return build_card(**raw)
+
+
+class CardStream:
+    """Card mới của 1 lần tìm kiếm (tạo mới cho mỗi task, trang mới thì DOM chưa có dấu)."""
+
+    def __init__(self, driver, mode=EXTRACT_JSON):
+        if mode not in (EXTRACT_JSON, EXTRACT_HTML):
+            raise ValueError(f"CARD_EXTRACTOR không hợp lệ: {mode!r} (json|html)")
+        self.driver = driver
+        self.mode = mode
+        self.emitted = set()   # place_id đã đẩy đi
+        self.claimed = set()   # place_id đã lấy từ nguồn khác (NetworkCardStream) → bỏ qua, không tính trùng
+        self.marked = 0        # số node card đã đánh dấu trong DOM (kể cả card trùng)
+        self.count = 0         # số card đã đẩy đi
+        self.duplicates = 0
+
+    def poll(self, final=False):
+        """
+        Các card mới kể từ lần gọi trước (theo thứ tự feed) và số card đó:
+        mode "json" → list dict thô của cardFields; mode "html" → chuỗi HTML nối liền.
+        """
+        rows = self.driver.execute_script(_NEW_CARDS_JS, bool(final), self.mode == EXTRACT_JSON)
+        self.marked += len(rows)
+        out = []
+        for place_id, payload in rows:
+            if place_id:
+                if place_id in self.claimed:
+                    continue
+                if place_id in self.emitted:
+                    self.duplicates += 1
+                    continue
+                self.emitted.add(place_id)
+            out.append(payload)
+        self.count += len(out)
+        return (out if self.mode == EXTRACT_JSON else "".join(out)), len(out)
+
+
+class NetworkCardStream:
+    """
+    Card của 1 lần tìm kiếm lấy từ response XHR (SearchCapture), DOM bù phần còn thiếu
+    (trang đầu khi mở thẳng URL nằm sẵn trong HTML, không qua XHR; payload đổi cấu trúc...).
+    Tạo trước khi điều hướng để không lỡ response của trang đầu. poll() trả list dict thô như mode "json".
+    """
+
+    mode = EXTRACT_JSON   # poll() trả list dict thô như CardStream mode "json"
+
+    def __init__(self, driver):
+        self.capture = SearchCapture(driver)
+        self.dom = CardStream(driver, EXTRACT_JSON)
+        self.from_network = 0
+        self._net_duplicates = 0
+
+    @property
+    def marked(self):
+        return self.dom.marked
+
+    @property
+    def count(self):
+        return self.from_network + self.dom.count
+
+    @property
+    def duplicates(self):
+        return self._net_duplicates + self.dom.duplicates
+
+    def poll(self, final=False):
+        out = []
+        for raw in self.capture.places():
+            place_id = parse_href(raw["href"])[0]
+            if place_id and place_id != 'N/A':
+                if place_id in self.dom.claimed or place_id in self.dom.emitted:
+                    self._net_duplicates += 1
+                    continue
+                self.dom.claimed.add(place_id)
+            out.append(raw)
+        self.from_network += len(out)
+        # response về trước khi card được render → DOM thường chỉ còn các card XHR không có
+        dom_cards, _ = self.dom.poll(final)
+        out.extend(dom_cards)
+        return out, len(out)
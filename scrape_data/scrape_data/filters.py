@@ -0,0 +1,124 @@
+# filters.py
+# Bộ lọc card: thuộc địa bàn mục tiêu (theo địa chỉ)
+# (tách khỏi scraper.py để các stage của pipeline dùng chung; bộ lọc loại trừ theo tên nằm ở classifier.py)
+
+import re
+import unicodedata
+from functools import lru_cache
+
+
+# ========= Helpers lọc địa bàn (4 trường hợp, có quận/huyện/tx/tp và viết tắt) =========
+
+_PFX_DIST = [
+    "huyện", "quận", "thị xã", "thi xa", "thành phố", "thanh pho",
+    "h.", "q.", "tx.", "tp.", "h", "q", "tx", "tp"
+]
+_PFX_PROV = ["tỉnh", "tinh", "thành phố", "thanh pho", "tp.", "tp"]
+
+_RE_PUNCT = re.compile(r"[^\w\s]")
+_RE_SPACES = re.compile(r"\s+")
+
+def _strip_accents(s: str) -> str:
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s
+
+@lru_cache(maxsize=65536)
+def _norm(s: str) -> str:
+    # memo: cùng 1 địa chỉ/tên huyện được chuẩn hoá lặp lại qua 15 keyword của 1 huyện
+    s = _strip_accents(s or "").lower()
+    s = _RE_PUNCT.sub(" ", s)          # bỏ dấu câu
+    s = _RE_SPACES.sub(" ", s).strip()  # chuẩn hoá khoảng trắng
+    return s
+
+@lru_cache(maxsize=None)
+def _norm_prefixes(prefixes: tuple):
+    """Tiền tố đã chuẩn hoá, dài trước ngắn sau (tính 1 lần cho mỗi bộ tiền tố)."""
+    return tuple(_norm(p) for p in sorted(prefixes, key=len, reverse=True))
+
+def _remove_leading_prefix(s: str, prefixes) -> str:
+    """
+    Bỏ các tiền tố hành chính đứng đầu, ví dụ:
+    'huyện ba vì' -> 'ba vì', 'quận tây hồ' -> 'tây hồ', 'tp. ha noi' -> 'ha noi'
+    """
+    ns = _norm(s)
+    for p_norm in _norm_prefixes(tuple(prefixes)):
+        if ns.startswith(p_norm + " "):
+            return ns[len(p_norm):].strip()
+    return ns
+
+def _mk_district_variants(district: str):
+    """
+    Sinh các biến thể cho district:
+    - nguyên văn (chuẩn hoá): 'huyen ba vi', 'quan ba dinh', ...
+    - chỉ tên trần: 'ba vi', 'ba dinh'
+    - viết tắt có tiền tố: 'h ba vi', 'h. ba vi', 'q ba dinh', 'q. ba dinh', 'tx son tay', 'tp thu duc'
+    """
+    ns_full = _norm(district)
+    bare = _remove_leading_prefix(district, _PFX_DIST)
+
+    variants = set()
+    variants.add(ns_full)
+    variants.add(bare)
+
+    # thêm dạng viết tắt/tiền tố rút gọn phổ biến
+    for p in ["huyen", "h.", "h", "quan", "q.", "q", "thi xa", "tx.", "tx", "thanh pho", "tp.", "tp"]:
+        variants.add(f"{p} {bare}")
+
+    return {v.strip() for v in variants if v.strip()}
+
+def _mk_province_variants(province: str):
+    """
+    Sinh các biến thể cho province:
+    - nguyên văn: 'thanh pho ha noi', 'tinh bac ninh'...
+    - rút gọn bỏ tiền tố: 'ha noi', 'bac ninh'
+    - viết tắt phổ biến: 'tp ha noi', 'tp. ha noi'
+    """
+    ns_full = _norm(province)
+    bare = _remove_leading_prefix(province, _PFX_PROV)
+
+    variants = set()
+    variants.add(ns_full)
+    variants.add(bare)
+    for p in ["thanh pho", "tp.", "tp", "tinh"]:
+        variants.add(f"{p} {bare}")
+
+    return {v.strip() for v in variants if v.strip()}
+
+def _minimal_terms(terms):
+    """
+    Bỏ các biến thể chứa 1 biến thể khác bên trong: với phép "chứa chuỗi con", khớp 'huyen ba vi'
+    kéo theo khớp 'ba vi', nên chỉ cần giữ chuỗi ngắn — kết quả không đổi, ít nhánh hơn.
+    """
+    terms = sorted(set(terms), key=len)
+    kept = []
+    for t in terms:
+        if not any(k in t for k in kept):
+            kept.append(t)
+    return kept
+
+@lru_cache(maxsize=4096)
+def area_matcher(district: str, province: str):
+    """
+    Regex gộp mọi biến thể district + province của 1 combo, biên dịch 1 lần rồi cache.
+    Dùng .search(_norm(addr)) — tương đương any(v in addr_norm ...) của bản cũ.
+    """
+    terms = _minimal_terms(_mk_district_variants(district) | _mk_province_variants(province))
+    return re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)))
+
+def in_target_area(addr: str, district: str, province: str) -> bool:
+    """
+    NHẸ TAY: Chỉ cần KHỚP MỘT trong hai:
+      - addr chứa 1 biến thể của district (quận/huyện/thị xã/thành phố, viết tắt…)
+      - HOẶC addr chứa 1 biến thể của province (tỉnh/thành phố, viết tắt…)
+
+    Nghĩa là chỉ cần có 'Ba Vì' HOẶC có 'Hà Nội' (kể cả các biến thể như 'Q.', 'TP.', 'Thành phố'…)
+    là pass bộ lọc.
+    """
+    if not addr:
+        return False
+
+    # ĐIỂM KHÁC BIỆT: chỉ cần 1 trong 2 là True → gộp chung 1 regex, quét địa chỉ 1 lần
+    return area_matcher(district, province).search(_norm(addr)) is not None
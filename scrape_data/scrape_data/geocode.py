@@ -1,32 +1,266 @@
 # geocode.py
 # Reverse geocoding từ lat/lng -> địa chỉ chi tiết (display_name OSM)
+#
+# Cache 2 tầng:
+#   1) _cache: dict trong tiến trình
+#   2) cache bền (tuỳ GEOCODE_CACHE_BACKEND): bảng Postgres geocode_cache (dùng chung mọi worker/máy)
+#      hoặc file SQLite (1 máy). Read-through/write-through, có TTL.
+# → chạy lại không tốn request Nominatim cho toạ độ đã resolve.
+# Ngoài ra warm_from_stores() nạp sẵn địa chỉ đã có trong grocery_stores (theo toạ độ và place_id).
 
+import os
 import time
+import sqlite3
+import threading
 import requests
-from config import OSM_USER_AGENT, OSM_RATE_LIMIT_SLEEP
+from dbpool import execute_prepared
+from config import (
+    OSM_USER_AGENT, OSM_RATE_LIMIT_SLEEP,
+    GEOCODE_CACHE_BACKEND, GEOCODE_CACHE_SQLITE_PATH, GEOCODE_CACHE_TTL_DAYS, GEOCODE_CACHE_PRECISION
+)
 
 _cache = {}
+_place_cache = {}   # place_id -> address (nạp từ grocery_stores)
+_stats = {"mem_hits": 0, "place_hits": 0, "store_hits": 0, "misses": 0, "errors": 0}
 
-def reverse_geocode(lat, lng):
+# Rate limit Nominatim (~1 request/giây). Mặc định chỉ trong 1 tiến trình;
+# chế độ nhiều worker gọi configure_shared_rate_limit() để dùng chung giữa các tiến trình.
+_rate_lock = threading.Lock()
+_rate_last = None   # multiprocessing.Value('d') khi dùng chung
+_rate_last_local = 0.0
+
+def configure_shared_rate_limit(lock, last_value):
+    """Dùng lock + Value('d') chia sẻ giữa các tiến trình worker."""
+    global _rate_lock, _rate_last
+    _rate_lock = lock
+    _rate_last = last_value
+
+def _wait_rate_limit():
+    """Chặn cho tới khi được phép gọi Nominatim lần tiếp theo."""
+    global _rate_last_local
+    with _rate_lock:
+        last = _rate_last.value if _rate_last is not None else _rate_last_local
+        wait = last + OSM_RATE_LIMIT_SLEEP - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        now = time.time()
+        if _rate_last is not None:
+            _rate_last.value = now
+        else:
+            _rate_last_local = now
+
+# ========= Cache bền =========
+
+class _PgCache:
+    """Bảng geocode_cache (tạo bởi migrations.py), kết nối riêng cho thread geocode."""
+
+    def __init__(self, ttl_days):
+        from db import connect_postgres
+        self.ttl_days = ttl_days
+        self.conn, self.cur = connect_postgres()
+
+    def get(self, key):
+        execute_prepared(self.cur, "gc_get", """
+            SELECT address FROM geocode_cache
+            WHERE lat_key = %s AND lng_key = %s
+              AND created_at > NOW() - make_interval(days => %s);
+        """, (key[0], key[1], self.ttl_days))
+        row = self.cur.fetchone()
+        self.conn.commit()
+        return (True, row[0]) if row else (False, None)
+
+    def put(self, key, addr):
+        execute_prepared(self.cur, "gc_put", """
+            INSERT INTO geocode_cache (lat_key, lng_key, address, created_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (lat_key, lng_key) DO UPDATE
+              SET address = EXCLUDED.address, created_at = NOW();
+        """, (key[0], key[1], addr))
+        self.conn.commit()
+
+    def evict_expired(self):
+        self.cur.execute("DELETE FROM geocode_cache WHERE created_at < NOW() - make_interval(days => %s);",
+                         (self.ttl_days,))
+        self.conn.commit()
+        return self.cur.rowcount
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        from db import release_postgres
+        release_postgres(self.conn, self.cur)
+
+
+class _SqliteCache:
+    """File SQLite cho chạy 1 máy, không cần Postgres."""
+
+    def __init__(self, path, ttl_days):
+        self.ttl_seconds = ttl_days * 86400
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                lat_key REAL NOT NULL,
+                lng_key REAL NOT NULL,
+                address TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (lat_key, lng_key)
+            );
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT address FROM geocode_cache WHERE lat_key = ? AND lng_key = ? AND created_at > ?;",
+            (key[0], key[1], time.time() - self.ttl_seconds)
+        ).fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    def put(self, key, addr):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO geocode_cache (lat_key, lng_key, address, created_at) VALUES (?, ?, ?, ?);",
+            (key[0], key[1], addr, time.time())
+        )
+        self.conn.commit()
+
+    def evict_expired(self):
+        cur = self.conn.execute("DELETE FROM geocode_cache WHERE created_at < ?;", (time.time() - self.ttl_seconds,))
+        self.conn.commit()
+        return cur.rowcount
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+_store = None
+_store_pid = None
+_orphans = []   # store kế thừa từ tiến trình cha (fork): giữ tham chiếu, KHÔNG đóng (socket/file dùng chung với cha)
+
+def _open_store():
+    try:
+        if GEOCODE_CACHE_BACKEND == "postgres":
+            return _PgCache(GEOCODE_CACHE_TTL_DAYS)
+        if GEOCODE_CACHE_BACKEND == "sqlite":
+            return _SqliteCache(GEOCODE_CACHE_SQLITE_PATH, GEOCODE_CACHE_TTL_DAYS)
+    except Exception as e:
+        print(f"[WARN] Không mở được geocode cache ({GEOCODE_CACHE_BACKEND}): {e} -> chỉ dùng cache RAM")
+    return None
+
+def _get_store():
+    """Mở cache bền lần đầu dùng trong tiến trình (mỗi tiến trình 1 kết nối riêng, kể cả worker fork từ cha)."""
+    global _store, _store_pid
+    if _store_pid != os.getpid():
+        if _store is not None:
+            _orphans.append(_store)
+        _store_pid = os.getpid()
+        _store = _open_store()
+    return _store
+
+def _store_get(key):
+    store = _get_store()
+    if store is None:
+        return False, None
+    try:
+        return store.get(key)
+    except Exception:
+        _stats["errors"] += 1
+        store.rollback()
+        return False, None
+
+def _store_put(key, addr):
+    store = _get_store()
+    if store is None:
+        return
+    try:
+        store.put(key, addr)
+    except Exception:
+        _stats["errors"] += 1
+        store.rollback()
+
+def evict_expired():
+    """
+    Xoá các dòng cache quá GEOCODE_CACHE_TTL_DAYS. Trả về số dòng đã xoá.
+    Dùng kết nối tạm, đóng ngay → tiến trình cha gọi trước khi fork worker không để lại kết nối cho con kế thừa.
+    """
+    store = _open_store()
+    if store is None:
+        return 0
+    try:
+        return store.evict_expired()
+    except Exception:
+        store.rollback()
+        return 0
+    finally:
+        store.close()
+
+def cache_stats():
+    """Bộ đếm hit/miss của tiến trình hiện tại."""
+    return dict(_stats)
+
+def _key(latf, lngf):
+    return (round(latf, GEOCODE_CACHE_PRECISION), round(lngf, GEOCODE_CACHE_PRECISION))
+
+def warm_from_stores(cur):
+    """
+    Nạp địa chỉ đã lưu trong grocery_stores vào cache RAM (theo toạ độ làm tròn và theo place_id),
+    để card lặp lại giữa các keyword / lần chạy không phải gọi Nominatim. Trả về số dòng đã nạp.
+    """
+    cur.execute("""
+        SELECT place_id, latitude, longitude, address
+        FROM grocery_stores
+        WHERE address IS NOT NULL AND address <> ''
+          AND latitude IS NOT NULL AND longitude IS NOT NULL;
+    """)
+    n = 0
+    for place_id, latf, lngf, addr in cur.fetchall():
+        _cache.setdefault(_key(latf, lngf), addr)
+        if place_id and place_id != 'N/A':
+            _place_cache[place_id] = addr
+        n += 1
+    cur.connection.commit()
+    return n
+
+# ========= Reverse geocode =========
+
+def reverse_geocode(lat, lng, place_id=None):
     try:
         if lat in (None, 'N/A', '') or lng in (None, 'N/A', ''):
             return None
         latf = float(lat); lngf = float(lng)
-        key = (round(latf, 6), round(lngf, 6))
+        key = _key(latf, lngf)
         if key in _cache:
+            _stats["mem_hits"] += 1
             return _cache[key]
 
+        # cùng place_id đã có địa chỉ trong DB (toạ độ Google có thể lệch vài số lẻ giữa các lần)
+        if place_id and place_id in _place_cache:
+            _stats["place_hits"] += 1
+            addr = _place_cache[place_id]
+            _cache[key] = addr
+            return addr
+
+        found, addr = _store_get(key)
+        if found:
+            _stats["store_hits"] += 1
+            _cache[key] = addr
+            return addr
+
+        _stats["misses"] += 1
         url = "https://nominatim.openstreetmap.org/reverse"
         params = {"lat": key[0], "lon": key[1], "format": "jsonv2", "addressdetails": 1}
         headers = {"User-Agent": OSM_USER_AGENT}
 
+        _wait_rate_limit()
         resp = requests.get(url, params=params, headers=headers, timeout=15)
         if resp.status_code == 200:
             addr = resp.json().get("display_name")
             _cache[key] = addr
-            time.sleep(OSM_RATE_LIMIT_SLEEP)  
+            _store_put(key, addr)
             return addr
         return None
     except Exception:
         return None
-
@@ -0,0 +1,235 @@
+# migrations.py
+# Migration schema có đánh số phiên bản (bảng schema_version).
+#
+# - Khởi động (db.ensure_tables) chỉ còn 1 câu SELECT so phiên bản; không chạy DDL nếu đã mới nhất
+#   → không còn DROP/CREATE TRIGGER (ACCESS EXCLUSIVE trên grocery_stores) mỗi lần mở scraper.
+# - Mỗi migration chạy trong 1 transaction riêng, giữ pg_advisory_xact_lock để nhiều worker/máy
+#   khởi động cùng lúc không chạy chồng lên nhau.
+# - Thêm thay đổi schema mới: viết hàm _mNNN_xxx(cur) rồi thêm vào MIGRATIONS (không sửa migration cũ).
+#
+# Chạy: python migrations.py [--status]
+
+import argparse
+
+import psycopg2
+import psycopg2.errors
+
+from dbpool import statement_timeout
+
+# khoá advisory cố định cho migration (số tuỳ ý, chỉ cần không trùng khoá khác của app)
+_LOCK_KEY = 720_113
+
+
+def _m001_baseline(cur):
+    """Schema gốc: grocery_stores (+geom, trigger), crawl_progress. Dùng IF NOT EXISTS để áp được lên DB cũ."""
+    # PostGIS: không fatal nếu role không có quyền CREATE EXTENSION (savepoint để không hỏng transaction)
+    cur.execute("SAVEPOINT postgis;")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT postgis;")
+    cur.execute("RELEASE SAVEPOINT postgis;")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS grocery_stores (
+            id SERIAL PRIMARY KEY,
+            province TEXT,
+            district TEXT,
+            place_id TEXT UNIQUE,
+            name TEXT,
+            image TEXT,
+            rating TEXT,
+            category TEXT,
+            status TEXT,
+            closing_time TEXT,
+            phone TEXT,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            address TEXT,
+            map_url TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS address TEXT;")
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS map_url TEXT;")
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS geom geometry(Point,4326);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_province ON grocery_stores (province);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_district ON grocery_stores (district);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_latlng ON grocery_stores (latitude, longitude);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_geom ON grocery_stores USING GIST (geom);")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS crawl_progress (
+            province TEXT NOT NULL,
+            district TEXT NOT NULL,
+            keyword  TEXT NOT NULL,
+            status   TEXT NOT NULL DEFAULT 'pending',   -- pending|running|partial|done|failed
+            last_place_id TEXT,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            CONSTRAINT crawl_progress_pk PRIMARY KEY (province, district, keyword)
+        );
+    """)
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS last_place_id TEXT;")
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'pending';")
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW();")
+
+    # Trigger: tự động set geom khi có lat/lon
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION set_geom_from_latlon()
+        RETURNS trigger AS $$
+        BEGIN
+          IF NEW.longitude IS NOT NULL AND NEW.latitude IS NOT NULL THEN
+            NEW.geom := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326);
+          ELSE
+            NEW.geom := NULL;
+          END IF;
+          RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS trg_set_geom ON grocery_stores;")
+    cur.execute("""
+        CREATE TRIGGER trg_set_geom
+        BEFORE INSERT OR UPDATE OF latitude, longitude
+        ON grocery_stores
+        FOR EACH ROW
+        EXECUTE FUNCTION set_geom_from_latlon();
+    """)
+
+
+def _m002_crawl_lease(cur):
+    """Lease cho crawl phân tán (nhiều máy claim chung crawl_progress)."""
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS worker_id TEXT;")
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP;")
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;")
+    cur.execute("ALTER TABLE crawl_progress ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cp_claim ON crawl_progress (status, lease_until);")
+
+
+def _m003_geocode_cache(cur):
+    """Cache reverse geocode (geocode.py) dùng chung giữa các worker / lần chạy."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            lat_key DOUBLE PRECISION NOT NULL,
+            lng_key DOUBLE PRECISION NOT NULL,
+            address TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            CONSTRAINT geocode_cache_pk PRIMARY KEY (lat_key, lng_key)
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gc_created ON geocode_cache (created_at);")
+
+
+def _m004_store_change_tracking(cur):
+    """content_hash + last_seen_at cho upsert theo thay đổi (không index để bump last_seen_at là HOT update)."""
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP DEFAULT NOW();")
+
+
+def _m005_typed_store_columns(cur):
+    """
+    Cột có kiểu cho rating/review/phone/status (normalize.py điền; dữ liệu cũ: python normalize.py --backfill).
+    Cột text cũ giữ nguyên để không vỡ các nơi đang đọc.
+    """
+    cur.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'store_open_status') THEN
+                CREATE TYPE store_open_status AS ENUM ('open', 'closed', 'temp_closed', 'unknown');
+            END IF;
+        END$$;
+    """)
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS rating_value NUMERIC(2,1);")
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS review_count INTEGER;")
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS phone_e164 TEXT;")
+    cur.execute("ALTER TABLE grocery_stores ADD COLUMN IF NOT EXISTS open_status store_open_status;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gs_rating_value ON grocery_stores (rating_value) "
+                "WHERE rating_value IS NOT NULL;")
+
+
+def _m006_backfill_content_hash(cur):
+    """content_hash cho dòng cũ (sau 005 vì hash gồm cả cột có kiểu), không thì lần crawl đầu ghi lại cả bảng."""
+    from db import backfill_content_hash
+    backfill_content_hash(cur)
+
+
+# (phiên bản, mô tả, hàm) — chỉ thêm vào cuối
+MIGRATIONS = [
+    (1, "baseline", _m001_baseline),
+    (2, "crawl_progress lease", _m002_crawl_lease),
+    (3, "geocode_cache", _m003_geocode_cache),
+    (4, "grocery_stores content_hash/last_seen_at", _m004_store_change_tracking),
+    (5, "grocery_stores typed rating/review/phone/status", _m005_typed_store_columns),
+    (6, "grocery_stores content_hash backfill", _m006_backfill_content_hash),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cur, conn):
+    """Phiên bản schema hiện tại (0 nếu chưa có bảng schema_version)."""
+    try:
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+        version = cur.fetchone()[0]
+    except psycopg2.errors.UndefinedTable:
+        version = 0
+    conn.rollback()   # kết thúc transaction đọc (hoặc transaction lỗi)
+    return version
+
+
+def migrate(cur, conn, target=LATEST_VERSION):
+    """Áp các migration còn thiếu tới target. Trả về list phiên bản vừa áp."""
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version > target:
+            break
+        try:
+            # DDL/backfill có thể lâu: bỏ statement_timeout; chờ lock migration không giới hạn,
+            # còn lock trên bảng vẫn theo PG_LOCK_TIMEOUT_MS để không chặn app quá lâu
+            statement_timeout(cur, 0)
+            cur.execute("SET LOCAL lock_timeout = 0;")
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (_LOCK_KEY,))
+            cur.execute("SET LOCAL lock_timeout TO DEFAULT;")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                );
+            """)
+            # kiểm tra lại sau khi có lock: tiến trình khác có thể vừa áp xong
+            cur.execute("SELECT 1 FROM schema_version WHERE version = %s;", (version,))
+            if cur.fetchone():
+                conn.commit()
+                continue
+            fn(cur)
+            cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s);", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"[ERR] Migration {version} ({name}) lỗi, dừng ở phiên bản {version - 1}")
+            raise
+        print(f"[MIGRATE] {version:03d} {name}")
+        applied.append(version)
+    return applied
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migration schema Postgres cho scraper")
+    ap.add_argument("--status", action="store_true", help="chỉ in phiên bản hiện tại / mới nhất")
+    args = ap.parse_args()
+
+    from db import connect_postgres, release_postgres
+    conn, cur = connect_postgres()
+    try:
+        version = current_version(cur, conn)
+        print(f"[INFO] Schema: phiên bản {version}, mới nhất {LATEST_VERSION}")
+        if not args.status:
+            applied = migrate(cur, conn)
+            print(f"[INFO] Đã áp {len(applied)} migration" if applied else "[INFO] Schema đã mới nhất")
+    finally:
+        release_postgres(conn, cur)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# navigate.py
+# Đưa Chrome tới trang kết quả tìm kiếm Google Maps cho 1 query (config.NAV_MODE):
+#
+#   "inpage"   : Maps đã mở sẵn → gõ query vào ô tìm kiếm đang có, không tải lại bundle Maps;
+#                lần đầu (hoặc trang hiện tại không phải Maps) thì mở thẳng URL tìm kiếm
+#   "url"      : mỗi query driver.get(https://www.google.com/maps/search/<query>) — không qua trang chủ + gõ phím
+#   "homepage" : cách cũ — mở trang chủ Maps, chờ ô tìm kiếm, gõ, nghỉ 1s, Enter
+#
+# Thời gian điều hướng từng query được cộng dồn theo cách thực dùng (nav_stats) để so trước/sau.
+
+import time
+from urllib.parse import quote_plus
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from config import NAV_MODE, NAV_SEARCHBOX_TIMEOUT, NAV_STALE_TIMEOUT
+
+MAPS_HOME = "https://www.google.com/maps/"
+
+NAV_INPAGE = "inpage"
+NAV_URL = "url"
+NAV_HOMEPAGE = "homepage"
+NAV_MODES = (NAV_INPAGE, NAV_URL, NAV_HOMEPAGE)
+
+_FEED = (By.CSS_SELECTOR, 'div[role="feed"]')
+_SEARCHBOX = (By.ID, "searchboxinput")
+
+# cách thực dùng → [số query, tổng giây]
+_stats = {}
+
+
+def search_url(query):
+    return f"{MAPS_HOME}search/{quote_plus(query)}"
+
+
+def _maps_loaded(driver):
+    try:
+        return driver.current_url.startswith(MAPS_HOME) and bool(driver.find_elements(*_SEARCHBOX))
+    except Exception:
+        return False
+
+
+def _from_homepage(driver, query):
+    driver.get(MAPS_HOME)
+    box = WebDriverWait(driver, NAV_SEARCHBOX_TIMEOUT).until(EC.presence_of_element_located(_SEARCHBOX))
+    box.clear()
+    box.send_keys(query)
+    time.sleep(1)
+    box.send_keys(Keys.ENTER)
+
+
+def _in_page(driver, query):
+    """Gõ query vào ô tìm kiếm của trang Maps đang mở. False nếu kết quả cũ không được thay (cần tải lại)."""
+    old_feed = driver.find_elements(*_FEED)
+    box = driver.find_element(*_SEARCHBOX)
+    box.clear()
+    box.send_keys(query, Keys.ENTER)
+    if not old_feed:
+        return True
+    # feed của query trước phải bị thay, không thì bước chờ feed sẽ bắt nhầm kết quả cũ
+    try:
+        WebDriverWait(driver, NAV_STALE_TIMEOUT).until(EC.staleness_of(old_feed[0]))
+        return True
+    except TimeoutException:
+        return False
+
+
+def open_search(driver, query, mode=NAV_MODE):
+    """
+    Điều hướng tới kết quả tìm kiếm của query. Trả về cách thực dùng ("inpage" | "url" | "homepage").
+    Lỗi Selenium (không thấy ô tìm kiếm, Chrome chết...) để caller xử lý.
+    """
+    if mode not in NAV_MODES:
+        raise ValueError(f"NAV_MODE không hợp lệ: {mode!r} ({'|'.join(NAV_MODES)})")
+    if mode == NAV_HOMEPAGE:
+        _from_homepage(driver, query)
+        return NAV_HOMEPAGE
+    if mode == NAV_INPAGE and _maps_loaded(driver) and _in_page(driver, query):
+        return NAV_INPAGE
+    driver.get(search_url(query))
+    return NAV_URL
+
+
+def record(used, seconds):
+    """Cộng thời gian 1 query (điều hướng → có kết quả) vào thống kê của cách điều hướng đã dùng."""
+    st = _stats.setdefault(used, [0, 0.0])
+    st[0] += 1
+    st[1] += seconds
+
+
+def nav_stats():
+    """{cách điều hướng: (số query, giây trung bình / query)} của tiến trình hiện tại."""
+    return {k: (n, total / n) for k, (n, total) in _stats.items() if n}
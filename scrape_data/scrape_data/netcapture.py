@@ -0,0 +1,149 @@
+# netcapture.py
+# Bắt response XHR tìm kiếm của Google Maps (https://www.google.com/search?tbm=map...) qua performance log
+# của Chrome (CDP Network.*) và giải mã thành dict thô cho parser.build_card — không phải đọc lại DOM/regex href.
+#
+# - Chrome cần bật goog:loggingPrefs performance (enable_performance_log, build_driver tự gọi khi
+#   CARD_EXTRACTOR = "network"); body lấy bằng Network.getResponseBody ngay khi request xong
+# - Payload là mảng JSON lồng nhau không tài liệu: vị trí các trường (_P_*) dò theo response thực tế,
+#   Google đổi thì trường đó ra None (card thiếu tên/place_id bị bỏ, extract.NetworkCardStream lấy lại từ DOM)
+# - Thêm so với DOM: địa chỉ đầy đủ (bỏ qua Nominatim), số đánh giá
+
+import base64
+import json
+import re
+from urllib.parse import quote_plus
+
+from selenium.common.exceptions import WebDriverException
+
+_SEARCH_URL_RE = re.compile(r"^https://www\.google\.[a-z.]+/search\?(?:[^#]*&)?tbm=map")
+_XSSI = ")]}'"
+_XSSI_TAIL = '/*""*/'
+
+# vị trí trường trong mảng thông tin địa điểm (phần tử [14] của mỗi kết quả)
+_P_NAME = (11,)
+_P_LAT = (9, 2)
+_P_LNG = (9, 3)
+_P_RATING = (4, 7)
+_P_REVIEWS = (4, 8)
+_P_ADDRESS = (39,)
+_P_FEATURE_ID = (10,)
+_P_PLACE_ID = (78,)
+_P_PHONE = (178, 0, 0)
+_P_HOURS = (34, 4, 4)       # "Đang mở cửa ⋅ Đóng cửa lúc 22:00"
+_P_PHOTO = (72, 0, 0, 6, 0)
+
+
+def enable_performance_log(options):
+    """Bật performance log (chỉ sự kiện Network) cho ChromeOptions."""
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+
+def _at(obj, *path):
+    for i in path:
+        if not isinstance(obj, list) or not -len(obj) <= i < len(obj):
+            return None
+        obj = obj[i]
+    return obj
+
+
+def _loads_xssi(text):
+    text = text.strip()
+    if text.startswith(_XSSI):
+        text = text[len(_XSSI):]
+    if text.endswith(_XSSI_TAIL):
+        text = text[:-len(_XSSI_TAIL)]
+    return json.loads(text)
+
+
+def _place_href(name, feature_id, lat, lng, place_id):
+    # dạng giống href của card để parser.parse_href đọc lại place_id / lat / lng
+    data = f"!4m7!3m6!1s{feature_id or ''}!8m2!3d{lat}!4d{lng}!19s{place_id}"
+    return f"https://www.google.com/maps/place/{quote_plus(name)}/data={data}"
+
+
+def place_fields(info):
+    """Mảng thông tin 1 địa điểm → kwargs cho parser.build_card; None nếu thiếu tên / place_id / toạ độ."""
+    name, place_id = _at(info, *_P_NAME), _at(info, *_P_PLACE_ID)
+    lat, lng = _at(info, *_P_LAT), _at(info, *_P_LNG)
+    if not isinstance(name, str) or not isinstance(place_id, str) \
+            or not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+        return None
+
+    rating, reviews = _at(info, *_P_RATING), _at(info, *_P_REVIEWS)
+    status = closing_time = None
+    hours = _at(info, *_P_HOURS)
+    if isinstance(hours, str) and hours.strip():
+        status, _, closing_time = hours.partition("⋅")
+        closing_time = closing_time or None
+    phone, address, photo = _at(info, *_P_PHONE), _at(info, *_P_ADDRESS), _at(info, *_P_PHOTO)
+    return {
+        "name": name,
+        "href": _place_href(name, _at(info, *_P_FEATURE_ID), float(lat), float(lng), place_id),
+        "image": photo if isinstance(photo, str) else None,
+        # cùng dạng text với card DOM (locale vi: '4,6', '(1.234)')
+        "rating": f"{rating:.1f}".replace(".", ",") if isinstance(rating, (int, float)) else None,
+        "reviews": str(reviews) if isinstance(reviews, int) else None,
+        "status": status,
+        "closing_time": closing_time,
+        "phone": phone if isinstance(phone, str) else None,
+        "address": address if isinstance(address, str) else None,
+    }
+
+
+def decode_search_response(text):
+    """Body response tìm kiếm → list kwargs build_card theo thứ tự kết quả."""
+    data = _loads_xssi(text)
+    if isinstance(data, dict) and "d" in data:
+        data = _loads_xssi(data["d"])
+    out = []
+    for item in _at(data, 0, 1) or []:
+        info = _at(item, 14)
+        fields = place_fields(info) if isinstance(info, list) else None
+        if fields:
+            out.append(fields)
+    return out
+
+
+class SearchCapture:
+    """Đọc dần performance log của 1 Chrome, trả về các địa điểm trong response tìm kiếm mới."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._pending = set()   # requestId của response tìm kiếm chưa tải xong
+        self.responses = 0
+        self.errors = 0
+        self._drain()           # bỏ log của trang/task trước
+
+    def _drain(self):
+        try:
+            return self.driver.get_log('performance')
+        except WebDriverException:
+            return []
+
+    def _body(self, request_id):
+        res = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        body = res.get('body', '')
+        return base64.b64decode(body).decode('utf-8') if res.get('base64Encoded') else body
+
+    def places(self):
+        out = []
+        for entry in self._drain():
+            raw = entry.get('message', '')
+            if '"Network.responseReceived"' not in raw and '"Network.loadingFinished"' not in raw:
+                continue
+            msg = json.loads(raw).get('message', {})
+            params = msg.get('params', {})
+            request_id = params.get('requestId')
+            if msg.get('method') == 'Network.responseReceived':
+                if _SEARCH_URL_RE.match(params.get('response', {}).get('url', '')):
+                    self._pending.add(request_id)
+            elif msg.get('method') == 'Network.loadingFinished' and request_id in self._pending:
+                self._pending.discard(request_id)
+                try:
+                    out.extend(decode_search_response(self._body(request_id)))
+                    self.responses += 1
+                except (WebDriverException, ValueError, UnicodeDecodeError) as e:
+                    self.errors += 1
+                    print(f"[WARN] Không đọc được response tìm kiếm: {e}")
+        return out
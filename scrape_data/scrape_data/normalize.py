@@ -0,0 +1,177 @@
+# normalize.py
+# Chuẩn hoá các trường "nóng" của card sang cột có kiểu trong grocery_stores:
+#   rating       '4,5' / '4.5'              → rating_value NUMERIC(2,1)
+#   '(1.234)'                                → review_count INTEGER
+#   phone        '0912 345 678' / '024 ...'  → phone_e164 '+84912345678' (hotline 1800/1900 → NULL)
+#   status       'Đang mở cửa' / 'Đã đóng cửa' / 'Tạm thời đóng cửa' → open_status (enum store_open_status)
+# và 'N/A' → NULL. Dùng chung cho parser.parse_business_card và backfill dữ liệu cũ.
+#
+# Chạy: python normalize.py --backfill [--dry-run]
+
+import argparse
+import re
+from decimal import Decimal, InvalidOperation
+
+from filters import _norm
+
+NA = "N/A"
+
+# giá trị enum store_open_status (migration 005)
+OPEN = "open"
+CLOSED = "closed"
+TEMP_CLOSED = "temp_closed"
+UNKNOWN = "unknown"
+
+# so trên chuỗi đã bỏ dấu (kể cả đ → d); khớp theo thứ tự, luật đầu tiên thắng:
+# 'Sắp đóng cửa' vẫn đang mở, 'Sắp mở cửa' thì đang đóng
+_STATUS_RULES = [
+    (("tam thoi dong cua", "dong cua tam thoi", "temporarily closed"), TEMP_CLOSED),
+    (("sap dong cua", "closes soon", "dang mo cua", "mo cua ca ngay", "mo cua 24", "open 24"), OPEN),
+    (("dong cua", "closed", "sap mo cua", "opens soon"), CLOSED),
+    (("mo cua", "open"), OPEN),
+]
+_RATING_RE = re.compile(r"\d(?:[.,]\d)?")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def na_to_none(value):
+    """'N/A' / chuỗi rỗng → None, còn lại giữ nguyên (đã strip)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if not value or value == NA else value
+
+
+def parse_rating(text):
+    """'4,5' → Decimal('4.5'); None nếu không đọc được hoặc ngoài 0..5."""
+    text = na_to_none(text)
+    if not text:
+        return None
+    m = _RATING_RE.search(text)
+    if not m:
+        return None
+    try:
+        value = Decimal(m.group(0).replace(",", "."))
+    except InvalidOperation:
+        return None
+    return value if 0 <= value <= 5 else None
+
+
+def parse_review_count(text):
+    """'(1.234)' / '(1,234)' / '1234' → 1234."""
+    text = na_to_none(text)
+    if not text:
+        return None
+    digits = "".join(_DIGITS_RE.findall(text))
+    return int(digits) if digits else None
+
+
+def normalize_phone(text):
+    """Số VN → E.164 (+84...). Đầu số dịch vụ 1800/1900 và chuỗi không hợp lệ → None."""
+    text = na_to_none(text)
+    if not text:
+        return None
+    digits = "".join(_DIGITS_RE.findall(text))
+    if text.lstrip().startswith("+"):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    if digits.startswith("84") and len(digits) in (11, 12):
+        return f"+{digits}"
+    if digits.startswith("0") and len(digits) in (10, 11):
+        return f"+84{digits[1:]}"
+    return None
+
+
+def parse_open_status(text):
+    """Chuỗi trạng thái trên card → 'open' | 'closed' | 'temp_closed' | 'unknown'."""
+    text = na_to_none(text)
+    if not text:
+        return UNKNOWN
+    folded = _norm(text).replace("đ", "d")
+    for needles, status in _STATUS_RULES:
+        if any(n in folded for n in needles):
+            return status
+    return UNKNOWN
+
+
+def typed_fields(rating, phone, status):
+    """Các cột có kiểu suy ra từ cột text (review_count lấy riêng từ card)."""
+    return {
+        "rating_value": parse_rating(rating),
+        "phone_e164": normalize_phone(phone),
+        "open_status": parse_open_status(status),
+    }
+
+
+# ========= Backfill dữ liệu cũ =========
+
+_TEXT_NA_COLUMNS = ("image", "rating", "status", "closing_time", "phone")
+
+
+def backfill_typed_columns(cur, conn, batch_size=5000, dry_run=False):
+    """
+    Điền rating_value / phone_e164 / open_status cho grocery_stores (đọc theo keyset id) và đổi 'N/A' → NULL
+    ở các cột text. Chỉ UPDATE dòng có thay đổi; content_hash tính lại luôn để upsert sau không ghi lại lần nữa
+    (dòng không đổi nhưng chưa có hash cũng được điền ở cuối). Trả về số dòng (sẽ) cập nhật.
+    """
+    import psycopg2.extras
+    from db import content_hash_sql, backfill_content_hash
+
+    cols = ("id",) + _TEXT_NA_COLUMNS + ("rating_value", "phone_e164", "open_status")
+    updated = 0
+    last_id = 0
+    while True:
+        cur.execute(f"""
+            SELECT {", ".join(cols)} FROM grocery_stores
+            WHERE id > %s ORDER BY id LIMIT %s;
+        """, (last_id, batch_size))
+        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        changes = []
+        for r in rows:
+            new = {c: na_to_none(r[c]) for c in _TEXT_NA_COLUMNS}
+            new.update(typed_fields(new["rating"], new["phone"], new["status"]))
+            if any(new[c] != r[c] for c in new):
+                new["id"] = r["id"]
+                changes.append(new)
+        updated += len(changes)
+
+        if changes and not dry_run:
+            set_cols = _TEXT_NA_COLUMNS + ("rating_value", "phone_e164", "open_status")
+            new_hash = content_hash_sql(lambda c: f"v.{c}" if c in set_cols else f"g.{c}")
+            psycopg2.extras.execute_values(cur, f"""
+                UPDATE grocery_stores AS g
+                SET {", ".join(f"{c} = v.{c}" for c in set_cols)},
+                    content_hash = {new_hash}
+                FROM (VALUES %s) AS v (id, {", ".join(set_cols)})
+                WHERE g.id = v.id;
+            """, changes, template="(%(id)s, " + ", ".join(f"%({c})s" for c in _TEXT_NA_COLUMNS)
+                                   + ", %(rating_value)s::numeric(2,1), %(phone_e164)s, "
+                                     "%(open_status)s::store_open_status)", page_size=1000)
+        conn.commit()
+    if not dry_run:
+        backfill_content_hash(cur, conn)
+    return updated
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chuẩn hoá rating/phone/status của grocery_stores sang cột có kiểu")
+    ap.add_argument("--backfill", action="store_true", help="điền cột có kiểu + đổi 'N/A' → NULL cho dữ liệu cũ")
+    ap.add_argument("--dry-run", action="store_true", help="chỉ đếm, không ghi DB")
+    args = ap.parse_args()
+
+    if args.backfill:
+        from db import connect_postgres, release_postgres, ensure_tables
+        conn, cur = connect_postgres()
+        try:
+            ensure_tables(cur, conn)
+            n = backfill_typed_columns(cur, conn, dry_run=args.dry_run)
+        finally:
+            release_postgres(conn, cur)
+        print(f"[BACKFILL] {n} dòng{' (dry-run)' if args.dry_run else ' đã cập nhật'}")
+
+
+if __name__ == "__main__":
+    main()
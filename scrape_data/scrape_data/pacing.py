@@ -0,0 +1,131 @@
+# pacing.py
+# Chờ theo tín hiệu sẵn sàng của trang thay cho sleep cố định, và chính sách "lịch sự" điều nhịp truy vấn.
+#
+# - wait_search_ready: sau khi tìm, chờ tới khi có feed (≥1 card) / CAPTCHA / trang 1 địa điểm, không ngủ 5–8s
+# - NET_IDLE_JS: số ms từ lần cuối trang nhận dữ liệu (Resource Timing) hoặc lần cuộn cuối
+#   (MARK_SCROLL_JS) → "mạng yên" thay cho ngủ cố định sau mỗi lần cuộn
+# - Politeness (1 instance mỗi tiến trình = mỗi Chrome, lấy qua policy()):
+#     before_search(): giãn cách tối thiểu giữa 2 lần tìm (tính từ lần tìm trước, có jitter),
+#                      gặp CAPTCHA thì nhân giãn cách lên (backoff), tìm trơn tru thì giảm dần về 1x
+#     scroll_gap():    giãn cách tối thiểu giữa 2 lần cuộn — chỉ ngủ phần còn thiếu, không cộng thêm sau khi chờ
+# - PhaseTimer: thời gian từng pha của 1 task để log
+
+import random
+import time
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+from config import (
+    POLITE_SEARCH_INTERVAL, POLITE_JITTER, POLITE_CAPTCHA_BACKOFF, POLITE_BACKOFF_MAX,
+    SCROLL_GAP_MINMAX, SEARCH_READY_TIMEOUT, WAIT_POLL_SECONDS
+)
+
+# trạng thái trang sau khi tìm: 'feed' | 'captcha' | 'place' (Maps mở thẳng 1 địa điểm) | null (chưa xong)
+_SEARCH_STATE_JS = """
+const feed = document.querySelector('div[role="feed"]');
+if (feed && feed.querySelector('div.Nv2PK')) return 'feed';
+if (location.href.includes('/sorry/') || document.querySelector('#captcha-form, iframe[src*="recaptcha"]')) return 'captcha';
+if (!location.pathname.startsWith('/maps')) {
+  const body = document.body ? document.body.textContent.toLowerCase() : '';
+  if (body.includes('unusual traffic') || body.includes('captcha')) return 'captcha';
+}
+if (location.pathname.includes('/maps/place/') && !feed) return 'place';
+return null;
+"""
+
+# ms kể từ lần cuối trang nhận xong 1 resource (XHR/fetch/ảnh...) hoặc lần cuộn cuối; dọn buffer Resource Timing
+# để không bị đầy (đầy thì trình duyệt ngừng ghi entry mới)
+NET_IDLE_JS = """
+let last = Math.max(window.__scrNetLast || 0, window.__scrScrollAt || 0);
+const es = performance.getEntriesByType('resource');
+for (const e of es) if (e.responseEnd > last) last = e.responseEnd;
+window.__scrNetLast = last;
+if (es.length > 150) performance.clearResourceTimings();
+return performance.now() - last;
+"""
+
+MARK_SCROLL_JS = "window.__scrScrollAt = performance.now();"
+
+
+def wait_search_ready(driver, timeout=SEARCH_READY_TIMEOUT):
+    """Chờ kết quả tìm kiếm sẵn sàng. Trả về 'feed' | 'captcha' | 'place'; None nếu hết timeout."""
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL_SECONDS).until(
+            lambda d: d.execute_script(_SEARCH_STATE_JS)
+        )
+    except TimeoutException:
+        return None
+
+
+class Politeness:
+    """Nhịp truy vấn của 1 Chrome: giãn cách tìm kiếm (+ backoff khi CAPTCHA) và giãn cách cuộn."""
+
+    def __init__(self, search_interval=POLITE_SEARCH_INTERVAL, jitter=POLITE_JITTER,
+                 captcha_backoff=POLITE_CAPTCHA_BACKOFF, backoff_max=POLITE_BACKOFF_MAX,
+                 scroll_gap=SCROLL_GAP_MINMAX):
+        self.search_interval = search_interval
+        self.jitter = jitter
+        self.captcha_backoff = captcha_backoff
+        self.backoff_max = backoff_max
+        self.scroll_gap_minmax = scroll_gap
+        self.factor = 1.0
+        self._last_search = None
+        self._last_scroll = None
+
+    @staticmethod
+    def _sleep_until(since, gap):
+        if since is None:
+            return 0.0
+        wait = gap - (time.monotonic() - since)
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0.0
+
+    def before_search(self):
+        """Ngủ phần còn thiếu cho đủ giãn cách từ lần tìm trước. Trả về số giây đã ngủ."""
+        gap = self.search_interval * self.factor * random.uniform(1 - self.jitter, 1 + self.jitter)
+        waited = self._sleep_until(self._last_search, gap)
+        self._last_search = time.monotonic()
+        return waited
+
+    def scroll_gap(self):
+        waited = self._sleep_until(self._last_scroll, random.uniform(*self.scroll_gap_minmax))
+        self._last_scroll = time.monotonic()
+        return waited
+
+    def on_captcha(self):
+        self.factor = min(self.factor * self.captcha_backoff, self.backoff_max)
+        print(f"[WARN] CAPTCHA -> giãn cách tìm kiếm x{self.factor:g} ({self.search_interval * self.factor:.0f}s)")
+
+    def on_success(self):
+        if self.factor > 1.0:
+            self.factor = max(1.0, self.factor / self.captcha_backoff ** 0.5)
+
+
+_policy = None
+
+
+def policy():
+    """Politeness dùng chung trong tiến trình (mỗi worker là 1 tiến trình, 1 Chrome)."""
+    global _policy
+    if _policy is None:
+        _policy = Politeness()
+    return _policy
+
+
+class PhaseTimer:
+    """Đo thời gian từng pha: lap('tên') kết thúc pha hiện tại."""
+
+    def __init__(self):
+        self.phases = []
+        self._t = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._t))
+        self._t = now
+
+    def line(self):
+        return " | ".join(f"{name} {secs:.1f}s" for name, secs in self.phases)
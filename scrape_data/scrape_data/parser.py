@@ -74,11 +74,28 @@
 
 # parser.py
 # Tách và gom logic parse 1 "business card" trong list GMaps.
+#
+# Backend parse HTML chọn được lúc chạy (config.PARSER_BACKEND, hoặc tham số backend=):
+#   "selectolax" (lexbor) | "lxml" | "bs4" (BeautifulSoup html.parser, luôn có)
+#   "auto": backend nhanh nhất đang cài. Mọi backend ra cùng 1 dict qua build_card.
 
 import re
 import unicodedata
 from bs4 import BeautifulSoup
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax chưa cài (hoặc bản cũ không có lexbor)
+    LexborHTMLParser = None
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml chưa cài
+    etree = None
+
+from classifier import classify
+from normalize import parse_review_count, typed_fields
+
 # ==== Helpers: bỏ dấu để so khớp không dấu ====
 def remove_accents(s: str) -> str:
     if not s:
@@ -88,129 +105,253 @@ def remove_accents(s: str) -> str:
 
 # ==== Phân loại cửa hàng ====
 def categorize(name: str) -> str:
-    """Trả về: 'Nhà thuốc' | 'Loại trừ' | 'Khác'"""
-    n = (name or "").lower().strip()
-    n_no = remove_accents(name or "").lower().strip()
-
-    # Từ khóa loại trừ (không thu thập)
-    exclude_keywords = [
-        "đông y", "nam dược", "cổ truyền", "y học cổ truyền",
-        "thuốc bắc", "thú y", "thú y viện", "pet", "veterinary","thuốc nam",
-        "dong y", "nam duoc", "co truyen", "y hoc co truyen",
-        "thuoc bac", "thu y", "thu y vien", "thuy vien", "thuoc nam"
-    ]
-    if any(k in n for k in exclude_keywords) or any(remove_accents(k) in n_no for k in exclude_keywords):
-        return "Loại trừ"
-
-    keywords_pharmacy = [
-        # Nhà thuốc
-        "nhà thuốc", "hiệu thuốc", "quầy thuốc", "tiệm thuốc",
-        "nhà thuốc tây", "nhà thuốc tư nhân",
-        "đại lý thuốc tây", "bán lẻ thuốc",
-        "siêu thị thuốc", "quầy bán thuốc", "phòng thuốc",
-        "thuốc tây",  # <- PHẢI có dấu phẩy ở đây
-
-        # Chuỗi lớn
-        "pharmacity", "long châu", "an khang", "guardian",
-        "eco", "trung sơn", "phano", "medicare",
-
-        # English
-        "pharmacy", "phamacy", "drugstore", "drug store", "chemist", "medical store",
-
-        # Thực phẩm chức năng (nhiều nhà thuốc có bán)
-        "thực phẩm chức năng", "tpcn", "cửa hàng thực phẩm chức năng",
-        "shop thực phẩm chức năng",
-        "siêu thị thực phẩm chức năng", "thực phẩm bảo vệ sức khỏe",
-        "dinh dưỡng", "bổ sung sức khỏe", "thảo dược", "sâm nhung",
-
-        # English supplements
-        "supplement", "dietary supplement", "nutraceutical",
-        "collagen", "omega", "ginseng", "herbal medicine",
-        "wellness store", "health supplement", "nutrition store"
-    ]
-
-    if any(k in n for k in keywords_pharmacy) or any(remove_accents(k) in n_no for k in keywords_pharmacy):
-        return "Nhà thuốc"
-
-    return "Khác"
+    """Trả về: 'Nhà thuốc' | 'Loại trừ' | 'Khác' (từ khoá và regex biên dịch sẵn trong classifier.py)"""
+    return classify(name)
 
 
 # ==== Parse business card ====
-def parse_business_card(div):
-    """
-    Nhận 1 thẻ <div.Nv2PK> và trích:
-    - name, place_id, map_url, image, rating, status, closing_time, phone
-    - lat, lng (từ href)
-    """
-    # Tên
-    name_tag = div.find('div', class_='qBF1Pd')
-    name = name_tag.text.strip() if name_tag else 'N/A'
+_PLACE_ID_RES = (re.compile(r'!19s([^!?]+)'), re.compile(r'data=[^!]+!1s([^!&]+)'))
+_LATLNG_RES = (re.compile(r'!3d(-?\d+\.\d+)!4d(-?\d+\.\d+)'), re.compile(r'/@(-?\d+\.\d+),(-?\d+\.\d+)'))
 
-    # URL + place_id + lat/lng
-    place_id = 'N/A'
-    map_url = None
-    lat, lng = None, None
 
-    link_tag = div.find('a', class_='hfpxzc', href=True)
-    if link_tag and 'href' in link_tag.attrs:
-        map_url = link_tag['href']
-        href = link_tag['href']
-
-        # place_id (nhiều pattern khác nhau)
-        m = (
-            re.search(r'!19s([^!?]+)', href) or
-            re.search(r'data=[^!]+!1s([^!&]+)', href)
-        )
+def parse_href(href):
+    """href của card → (place_id | 'N/A', lat, lng) (nhiều pattern khác nhau)."""
+    place_id, lat, lng = 'N/A', None, None
+    for rx in _PLACE_ID_RES:
+        m = rx.search(href)
         if m:
             place_id = m.group(1)
-
-        # lat/lng
-        m = (
-            re.search(r'!3d(-?\d+\.\d+)!4d(-?\d+\.\d+)', href) or
-            re.search(r'/@(-?\d+\.\d+),(-?\d+\.\d+)', href)
-        )
+            break
+    for rx in _LATLNG_RES:
+        m = rx.search(href)
         if m:
             lat, lng = m.groups()
+            break
+    return place_id, lat, lng
 
-    # Ảnh
-    image_url = 'N/A'
-    img_tag = div.find('img')
-    if img_tag and img_tag.get('src'):
-        image_url = img_tag['src']
-
-    # Rating
-    rating_tag = div.find('span', class_='MW4etd')
-    rating = rating_tag.text.strip() if rating_tag else 'N/A'
-
-    # Status / closing_time / phone
-    status, closing_time, phone = 'N/A', 'N/A', 'N/A'
-    info_tags = div.find_all('div', class_='W4Efsd')
-    if len(info_tags) > 1:
-        details_tag = info_tags[1]
-
-        # status có màu xanh (mở cửa) dạng style rgba(25,134,57
-        status_tag = details_tag.find('span', style=lambda v: v and 'rgba(25,134,57' in v)
-        status = status_tag.text.strip() if status_tag else 'N/A'
-
-        # giờ đóng/mở thường nằm trong span font-weight: 400
-        closing_time_tag = details_tag.find('span', style='font-weight: 400;')
-        # Google hay có " ⋅ " kèm, nên strip thêm
-        closing_time = closing_time_tag.text.strip(' ⋅ ').strip() if closing_time_tag else 'N/A'
-
-        # phone
-        phone_tag = details_tag.find('span', class_='UsdlK')
-        phone = phone_tag.text.strip() if phone_tag else 'N/A'
 
+def build_card(name=None, href=None, image=None, rating=None, reviews=None,
+               status=None, closing_time=None, phone=None, address=None):
+    """
+    Dict card chuẩn từ text thô của từng phần tử (None = không có phần tử đó).
+    Dùng chung cho parse_business_card (BeautifulSoup), extract.card_from_json (JS trong trang)
+    và netcapture (response tìm kiếm — chỉ nguồn này có address, card DOM để None).
+    """
+    name = name.strip() if name is not None else 'N/A'
+    place_id, lat, lng = parse_href(href) if href is not None else ('N/A', None, None)
+    rating = rating.strip() if rating is not None else None
+    status = status.strip() if status is not None else None
+    # Google hay có " ⋅ " kèm, nên strip thêm
+    closing_time = closing_time.strip(' ⋅ ').strip() if closing_time is not None else None
+    phone = phone.strip() if phone is not None else None
     return {
         "name": name,
         "category": categorize(name),
         "place_id": place_id,
-        "map_url": map_url,
-        "image": image_url,
+        "map_url": href,
+        "image": image or None,
         "rating": rating,
         "status": status,
         "closing_time": closing_time,
         "phone": phone,
+        "review_count": parse_review_count(reviews) if reviews is not None else None,
+        **typed_fields(rating, phone, status),   # rating_value, phone_e164, open_status
         "lat": lat,
         "lng": lng,
+        "address": address.strip() if address else None,
     }
+
+
+def _text(tag):
+    return tag.text if tag else None
+
+
+def parse_business_card(div):
+    """
+    Nhận 1 thẻ <div.Nv2PK> và trích:
+    - name, place_id, map_url, image, rating, status, closing_time, phone
+    - review_count + cột có kiểu rating_value, phone_e164, open_status (normalize.py)
+    - lat, lng (từ href)
+    """
+    link_tag = div.find('a', class_='hfpxzc', href=True)
+    img_tag = div.find('img')
+
+    # Status / closing_time / phone nằm ở dòng info thứ 2 (không có thì None, không dùng 'N/A')
+    status_tag = closing_time_tag = phone_tag = None
+    info_tags = div.find_all('div', class_='W4Efsd')
+    if len(info_tags) > 1:
+        details_tag = info_tags[1]
+        # status có màu xanh (mở cửa) dạng style rgba(25,134,57, đỏ (đóng cửa) rgba(217,48,37
+        status_tag = details_tag.find('span', style=lambda v: v and ('rgba(25,134,57' in v or 'rgba(217,48,37' in v))
+        # giờ đóng/mở thường nằm trong span font-weight: 400
+        closing_time_tag = details_tag.find('span', style='font-weight: 400;')
+        phone_tag = details_tag.find('span', class_='UsdlK')
+
+    return build_card(
+        name=_text(div.find('div', class_='qBF1Pd')),
+        href=link_tag['href'] if link_tag else None,
+        image=img_tag.get('src') if img_tag else None,
+        rating=_text(div.find('span', class_='MW4etd')),
+        reviews=_text(div.find('span', class_='UY7F9')),   # "(1.234)"
+        status=_text(status_tag),
+        closing_time=_text(closing_time_tag),
+        phone=_text(phone_tag),
+    )
+
+
+# ==== Backend parse cả đợt HTML (nhiều card) ====
+BACKEND_AUTO = "auto"
+BACKEND_SELECTOLAX = "selectolax"
+BACKEND_LXML = "lxml"
+BACKEND_BS4 = "bs4"
+PARSER_BACKENDS = (BACKEND_SELECTOLAX, BACKEND_LXML, BACKEND_BS4)   # thứ tự ưu tiên của "auto"
+
+_STATUS_COLORS = ('rgba(25,134,57', 'rgba(217,48,37')
+_CLOSING_STYLE = 'font-weight: 400;'
+
+
+def _is_status_style(style):
+    return bool(style) and any(c in style for c in _STATUS_COLORS)
+
+
+def _bs4_cards(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.find_all('div', class_=lambda x: x and 'Nv2PK' in x)
+
+
+# --- lxml: tách card bằng XPath biên dịch 1 lần, trong card đi 1 lượt qua các node con
+#     (nhanh hơn nhiều câu XPath theo class trên cây card sâu); khớp class theo token như BeautifulSoup class_= ---
+if etree is not None:
+    _LX_CARDS = etree.XPath("//div[contains(@class, 'Nv2PK')]")
+
+# (tag, class) → trường lấy phần tử đầu tiên khớp
+_LX_FIRST = {('div', 'qBF1Pd'): 'name', ('a', 'hfpxzc'): 'link', ('span', 'MW4etd'): 'rating', ('span', 'UY7F9'): 'reviews'}
+
+
+def _lx_text(el):
+    # itertext bỏ qua comment, giống tag.text của BeautifulSoup
+    return "".join(el.itertext()) if el is not None else None
+
+
+def _lxml_cards(html):
+    if not html.strip():
+        return []
+    return _LX_CARDS(lxml.html.document_fromstring(html))
+
+
+def _parse_card_lxml(div):
+    """parse_business_card cho phần tử lxml."""
+    first, info, img = {}, [], None
+    for el in div.iterdescendants('div', 'a', 'span', 'img'):
+        tag = el.tag
+        if tag == 'img':
+            if img is None:
+                img = el
+            continue
+        cls = el.get('class')
+        if not cls:
+            continue
+        for c in cls.split():
+            if tag == 'div' and c == 'W4Efsd':
+                info.append(el)
+            key = _LX_FIRST.get((tag, c))
+            if key and key not in first and (key != 'link' or el.get('href') is not None):
+                first[key] = el
+
+    status = closing_time = phone = None
+    if len(info) > 1:
+        for sp in info[1].iterdescendants('span'):
+            style = sp.get('style')
+            if status is None and _is_status_style(style):
+                status = sp
+            if closing_time is None and style == _CLOSING_STYLE:
+                closing_time = sp
+            if phone is None and 'UsdlK' in (sp.get('class') or '').split():
+                phone = sp
+
+    link = first.get('link')
+    return build_card(
+        name=_lx_text(first.get('name')),
+        href=link.get('href') if link is not None else None,
+        image=img.get('src') if img is not None else None,
+        rating=_lx_text(first.get('rating')),
+        reviews=_lx_text(first.get('reviews')),
+        status=_lx_text(status),
+        closing_time=_lx_text(closing_time),
+        phone=_lx_text(phone),
+    )
+
+
+# --- selectolax (lexbor): CSS selector ---
+def _sx_text(node):
+    return node.text(deep=True) if node is not None else None
+
+
+def _selectolax_cards(html):
+    return LexborHTMLParser(html).css("div[class*='Nv2PK']")
+
+
+def _parse_card_selectolax(div):
+    """parse_business_card cho node selectolax."""
+    link = div.css_first('a.hfpxzc[href]')
+    img = div.css_first('img')
+    status = closing_time = phone = None
+    info = div.css('div.W4Efsd')
+    if len(info) > 1:
+        spans = info[1].css('span[style]')
+        status = next((sp for sp in spans if _is_status_style(sp.attributes.get('style'))), None)
+        closing_time = next((sp for sp in spans if sp.attributes.get('style') == _CLOSING_STYLE), None)
+        phone = info[1].css_first('span.UsdlK')
+    return build_card(
+        name=_sx_text(div.css_first('div.qBF1Pd')),
+        href=link.attributes.get('href') if link is not None else None,
+        image=img.attributes.get('src') if img is not None else None,
+        rating=_sx_text(div.css_first('span.MW4etd')),
+        reviews=_sx_text(div.css_first('span.UY7F9')),
+        status=_sx_text(status),
+        closing_time=_sx_text(closing_time),
+        phone=_sx_text(phone),
+    )
+
+
+_BACKENDS = {
+    BACKEND_SELECTOLAX: (_selectolax_cards, _parse_card_selectolax),
+    BACKEND_LXML: (_lxml_cards, _parse_card_lxml),
+    BACKEND_BS4: (_bs4_cards, parse_business_card),
+}
+
+
+def available_backends():
+    """Các backend dùng được trong môi trường hiện tại (theo thứ tự ưu tiên)."""
+    installed = {
+        BACKEND_SELECTOLAX: LexborHTMLParser is not None,
+        BACKEND_LXML: etree is not None,
+        BACKEND_BS4: True,
+    }
+    return [b for b in PARSER_BACKENDS if installed[b]]
+
+
+def resolve_backend(name=BACKEND_AUTO):
+    """Tên backend sẽ dùng: "auto" → nhanh nhất đang cài; backend chưa cài → bs4 (kèm cảnh báo)."""
+    name = (name or BACKEND_AUTO).lower()
+    available = available_backends()
+    if name == BACKEND_AUTO:
+        return available[0]
+    if name not in _BACKENDS:
+        raise ValueError(f"PARSER_BACKEND không hợp lệ: {name!r} ({BACKEND_AUTO}|{'|'.join(PARSER_BACKENDS)})")
+    if name not in available:
+        print(f"[WARN] Parser backend '{name}' chưa cài -> dùng {BACKEND_BS4}")
+        return BACKEND_BS4
+    return name
+
+
+def split_cards(html, backend=BACKEND_AUTO):
+    """Tách đợt HTML thành các node card theo thứ tự feed. Trả về (nodes, hàm parse 1 node → dict)."""
+    find_cards, parse_card = _BACKENDS[resolve_backend(backend)]
+    return find_cards(html), parse_card
+
+
+def parse_cards(html, backend=BACKEND_AUTO):
+    """Parse cả đợt HTML → list dict (cùng dạng parse_business_card)."""
+    nodes, parse_card = split_cards(html, backend)
+    return [parse_card(n) for n in nodes]
@@ -0,0 +1,465 @@
+# pipeline.py
+# Pipeline nhiều stage chạy đồng thời: browse → parse → geocode → persist
+#
+# - browse (thread gọi submit_page / submit_cards, tức vòng lặp Selenium) chỉ lo tìm kiếm + cuộn, đẩy card
+#   (HTML hoặc dict lấy sẵn trong trang) theo từng đợt ngay trong lúc cuộn (final=True ở đợt cuối)
+# - parse / geocode / persist: mỗi stage 1 thread, nối nhau bằng queue có giới hạn
+#   → queue đầy thì stage trước bị chặn (backpressure), RAM không phình khi Nominatim chậm
+# - persist dùng kết nối Postgres riêng, ghi theo lô (db.StoreWriter: N dòng / T giây / cuối task);
+#   khi gặp mốc kết thúc task mới flush rồi ghi progress 'done'
+# - card có place_id đã biết trong huyện (seen.py) không geocode/upsert lại, chỉ refresh trường đổi theo lô
+# - checkpoint: cứ CHECKPOINT_EVERY_CARDS card, parse gửi mốc _Checkpoint(place_id) theo sau các card đó;
+#   persist ghi crawl_progress.last_place_id khi mọi card trước mốc đã được flush. Resume bỏ qua các card
+#   tới hết last_place_id (nếu không thấy lại card đó trong feed thì xử lý lại toàn bộ)
+# - giữ lease: thread riêng (kết nối riêng) gia hạn lease của mọi task đã vào pipeline mà chưa xong, cứ
+#   HEARTBEAT_SECONDS 1 lần — không phụ thuộc số card tới persist (card bị loại / đã biết / task đang chờ sau
+#   backlog của task trước vẫn được gia hạn)
+# - close(): đẩy sentinel qua từng stage, chờ xả hết hàng đợi (dùng cả khi Ctrl+C)
+
+import queue
+import threading
+import time
+from datetime import datetime
+
+from config import (
+    PIPELINE_PAGE_QUEUE, PIPELINE_CARD_QUEUE, HEARTBEAT_SECONDS, CHECKPOINT_EVERY_CARDS, PARSER_BACKEND
+)
+from db import connect_postgres, release_postgres, refresh_store_fields, StoreWriter
+from progress import progress_upsert, progress_release, progress_heartbeat, progress_checkpoint
+from geocode import reverse_geocode
+from parser import parse_business_card, resolve_backend, split_cards
+from extract import card_from_json
+from filters import in_target_area
+from classifier import is_excluded_by_name_or_category
+from seen import SeenRegistry
+from boundaries import in_area as boundary_in_area
+from bbox import build_bbox_index
+
+_STOP = object()
+
+
+class LeaseLost(Exception):
+    """Combo đã bị worker khác reclaim (lease hết hạn) — dừng task ngay."""
+
+
+class Task:
+    """1 combo (province, district, keyword) + bộ đếm đi xuyên qua các stage."""
+
+    def __init__(self, province, district, keyword, tag="", worker_id=None, resume_after=None):
+        self.province = province
+        self.district = district
+        self.keyword = keyword
+        self.tag = tag
+        self.worker_id = worker_id   # != None: combo được claim bằng lease (chế độ phân tán)
+        self.total_cards = 0
+        self.processed = 0
+        self.saved = 0               # insert mới + update có thay đổi
+        self.unchanged = 0
+        self.skipped_seen = 0
+        self.rejected_bbox = 0       # card bị loại bởi bounding box, không tốn geocode
+        self.refresh_rows = []       # card đã biết nhưng có trường thay đổi → UPDATE theo lô trước mỗi checkpoint / cuối task
+        self.refreshed = 0
+        self.seen = None             # DistrictSeen, gắn bởi Pipeline.attach_seen
+        self.beat_at = time.monotonic()    # lần gia hạn lease gần nhất
+        self.failed = False
+        self.lost = False
+        # checkpoint giữa feed
+        self.resume_after = resume_after   # last_place_id của lần chạy dở: bỏ qua card tới hết card này
+        self.resume_buffer = []            # card đã bỏ qua khi đang tìm resume_after (xử lý lại nếu không thấy)
+        self.resumed_skip = 0
+        self.since_checkpoint = 0
+        self.last_place_id = None          # place_id của card gần nhất đã qua stage parse
+        self.pending_checkpoint = None     # mốc đã tới persist, chờ flush xong mới ghi
+        self.checkpoint = resume_after
+        self.broken = False                # có card bị mất (lỗi parse/ghi lô) → không tiến checkpoint nữa
+
+    def __str__(self):
+        return f"{self.keyword} @ {self.district}, {self.province}"
+
+    def mark(self, cur, conn, status):
+        """Ghi trạng thái progress (qua lease nếu có worker_id)."""
+        if self.worker_id:
+            progress_release(cur, conn, self.province, self.district, self.keyword, self.worker_id, status)
+        else:
+            progress_upsert(cur, conn, self.province, self.district, self.keyword, status=status)
+
+    def save_checkpoint(self, cur, conn, place_id):
+        progress_checkpoint(cur, conn, self.province, self.district, self.keyword, place_id, self.worker_id)
+        self.checkpoint = place_id
+
+    def beat(self, cur, conn):
+        """
+        Gia hạn lease; raise LeaseLost nếu combo đã bị worker khác lấy.
+        Chế độ tuần tự / hàng đợi cũng có lease ('running' qua progress_upsert) nên cũng phải gia hạn,
+        không thì combo chạy lâu hơn LEASE_SECONDS bị 1 lần chạy --distributed claim lại.
+        """
+        self.beat_at = time.monotonic()
+        if not progress_heartbeat(cur, conn, self.province, self.district, self.keyword, self.worker_id):
+            self.lost = True
+            raise LeaseLost(str(self))
+
+
+class _TaskEnd:
+    """Mốc kết thúc 1 task, đi theo sau card cuối cùng của task qua mọi stage."""
+
+    def __init__(self, task):
+        self.task = task
+
+
+class _Checkpoint:
+    """Mọi card của task đứng trước place_id (theo thứ tự feed) đã đi qua stage parse."""
+
+    def __init__(self, task, place_id):
+        self.task = task
+        self.place_id = place_id
+
+
+class Pipeline:
+    def __init__(self, page_queue=PIPELINE_PAGE_QUEUE, card_queue=PIPELINE_CARD_QUEUE):
+        self.page_q = queue.Queue(maxsize=page_queue)
+        self.geo_q = queue.Queue(maxsize=card_queue)
+        self.save_q = queue.Queue(maxsize=card_queue)
+        self.saved_total = 0
+        self._seen = SeenRegistry()
+        self._live = {}                  # task đã vào pipeline, chưa _finish_task → cần giữ lease
+        self._live_lock = threading.Lock()   # _finish_task không ghi progress xen giữa 1 lần gia hạn
+        self._stopping = threading.Event()
+        self.parser_backend = resolve_backend(PARSER_BACKEND)
+
+        # mở kết nối ngay trên thread gọi để lỗi DB lộ ra sớm; sau đó chỉ stage persist dùng
+        self._conn, self._cur = connect_postgres()
+
+        try:
+            self._bbox = build_bbox_index(self._cur)
+        except Exception as e:
+            self._conn.rollback()
+            print(f"[WARN] Không dựng được bounding box địa bàn: {e}")
+            self._bbox = None
+
+        self._threads = [
+            threading.Thread(target=self._parse_stage, name="stage-parse", daemon=True),
+            threading.Thread(target=self._geocode_stage, name="stage-geocode", daemon=True),
+            threading.Thread(target=self._persist_stage, name="stage-persist", daemon=True),
+        ]
+        self._lease_thread = threading.Thread(target=self._lease_stage, name="stage-lease", daemon=True)
+        self._lease_thread.start()
+        for t in self._threads:
+            t.start()
+
+    # ---------- API cho stage browse ----------
+
+    def attach_seen(self, task, cur):
+        """Gắn seen-set của huyện cho task (nạp place_id đã có trong DB ở lần đầu gặp huyện)."""
+        task.seen = self._seen.get(cur, task.province, task.district)
+
+    def submit_page(self, task, html, final=True):
+        """
+        Đẩy 1 đợt HTML chứa các card (theo thứ tự feed) của task vào pipeline. Chặn nếu hàng đợi đầy.
+        final=True ở đợt cuối cùng của task (sau đó task được flush + ghi progress).
+        """
+        self._live[task] = None
+        self.page_q.put((task, html, final))
+
+    def submit_cards(self, task, cards, final=True):
+        """Như submit_page nhưng card đã được lấy sẵn trong trang (list dict thô của extract.CardStream mode json)."""
+        self._live[task] = None
+        self.page_q.put((task, list(cards), final))
+
+    def close(self):
+        """Xả hết các task đang dở trong hàng đợi rồi dừng mọi stage."""
+        self.page_q.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._stopping.set()
+        self._lease_thread.join()
+        release_postgres(self._conn, self._cur)
+
+    def backlog(self):
+        return self.page_q.qsize(), self.geo_q.qsize(), self.save_q.qsize()
+
+    # ---------- Giữ lease ----------
+
+    def _lease_stage(self):
+        conn = cur = None
+        try:
+            while not self._stopping.wait(1):
+                now = time.monotonic()
+                for task in list(self._live):
+                    if task.lost or now - task.beat_at < HEARTBEAT_SECONDS:
+                        continue
+                    if conn is None:
+                        conn, cur = connect_postgres()
+                    with self._live_lock:
+                        if task not in self._live:
+                            continue
+                        try:
+                            task.beat(cur, conn)
+                        except LeaseLost as e:
+                            print(f"{task.tag}[WARN] Mất lease (vẫn lưu phần đã crawl): {e}")
+                        except Exception as e:
+                            conn.rollback()
+                            print(f"{task.tag}[WARN] Không gia hạn được lease @ {task}: {e}")
+        finally:
+            if conn is not None:
+                release_postgres(conn, cur)
+
+    # ---------- Stage parse ----------
+
+    def _parse_stage(self):
+        while True:
+            item = self.page_q.get()
+            if item is _STOP:
+                self.geo_q.put(_STOP)
+                return
+            task, payload, final = item
+            try:
+                if isinstance(payload, str):
+                    cards, parse = split_cards(payload, self.parser_backend)
+                else:
+                    cards, parse = payload, card_from_json
+                start = task.total_cards
+                task.total_cards += len(cards)
+                if final:
+                    print(f"{task.tag}[DEBUG] Tổng {task.total_cards} kết quả @ {task.district}, {task.province}")
+                for seen, div in enumerate(cards, start + 1):
+                    self._parse_card(task, seen, div, parse)
+            except Exception as e:
+                task.failed = task.broken = True
+                print(f"{task.tag}[ERROR] Parse lỗi @ {task}: {e}")
+            finally:
+                if final:
+                    self._end_resume(task)
+                    self.geo_q.put(_TaskEnd(task))
+
+    def _parse_card(self, task, seen, card, parse=parse_business_card):
+        try:
+            info = parse(card)
+        except Exception as e:
+            print(f"{task.tag}   → [ERROR] card {seen} :: {e}")
+            return
+
+        # resume: card tới hết checkpoint lần trước đã xử lý xong
+        if task.resume_after:
+            if info.get("place_id") == task.resume_after:
+                task.resumed_skip = len(task.resume_buffer) + 1
+                task.resume_after = None
+                task.resume_buffer = []
+                print(f"{task.tag}[RESUME] Bỏ qua {task.resumed_skip} card đã xử lý ở lần trước @ {task}")
+            else:
+                task.resume_buffer.append((seen, info))
+            return
+
+        self._route_card(task, seen, info)
+
+        pid = info.get("place_id")
+        if pid and pid != 'N/A':
+            task.last_place_id = pid
+        task.since_checkpoint += 1
+        if task.since_checkpoint >= CHECKPOINT_EVERY_CARDS and task.last_place_id:
+            task.since_checkpoint = 0
+            self.geo_q.put(_Checkpoint(task, task.last_place_id))
+
+    def _end_resume(self, task):
+        """Hết feed mà không thấy lại card checkpoint (kết quả đã đổi) → xử lý các card đã tạm bỏ qua."""
+        if not task.resume_after:
+            return
+        buffered, task.resume_buffer, task.resume_after = task.resume_buffer, [], None
+        print(f"{task.tag}[RESUME] Không thấy card checkpoint trong feed, xử lý lại {len(buffered)} card @ {task}")
+        for seen, info in buffered:
+            self._route_card(task, seen, info)
+
+    def _route_card(self, task, seen, info):
+        short_name = "N/A"
+        try:
+            name_for_log = info.get("name") or "N/A"
+            short_name = (name_for_log[:60] + '...') if len(name_for_log) > 60 else name_for_log
+            print(f"{task.tag}[{seen:03d}/{task.total_cards}] Đang xử lý: {short_name} | Cat={info.get('category','')}")
+
+            # >>> Bộ lọc loại trừ đông y/nam dược/cổ truyền/thú y
+            if is_excluded_by_name_or_category(info):
+                print(f"{task.tag}   → [SKIP-EXCLUDE] {short_name} | Cat={info.get('category','')}")
+                return
+
+            # Bắt buộc có toạ độ thật (từ !3d..!4d..)
+            if not info["lat"] or not info["lng"]:
+                print(f"{task.tag}   → [SKIP-NO-COORD] {short_name}")
+                return
+
+            # ngoài hẳn hộp bao của huyện/tỉnh → loại luôn, không geocode
+            if self._bbox is not None and self._bbox.check(info["lat"], info["lng"], task.district, task.province) is False:
+                task.rejected_bbox += 1
+                print(f"{task.tag}   → [SKIP-BBOX] {short_name} | ({info['lat']},{info['lng']})")
+                return
+
+            # place_id đã biết trong huyện → không geocode/upsert lại
+            if task.seen is not None:
+                changed = task.seen.check(info)
+                if changed is not None:
+                    task.skipped_seen += 1
+                    if changed:
+                        task.refresh_rows.append(changed)
+                        print(f"{task.tag}   → [SEEN-CHANGED] {short_name}")
+                    else:
+                        print(f"{task.tag}   → [SEEN] {short_name}")
+                    return
+
+            self.geo_q.put((task, info, short_name))
+        except Exception as e:
+            print(f"{task.tag}   → [ERROR] {short_name} :: {e}")
+
+    # ---------- Stage geocode ----------
+
+    def _geocode_stage(self):
+        while True:
+            item = self.geo_q.get()
+            if item is _STOP or isinstance(item, (_TaskEnd, _Checkpoint)):
+                self.save_q.put(item)
+                if item is _STOP:
+                    return
+                continue
+
+            task, info, short_name = item
+            try:
+                # Lọc địa bàn offline bằng polygon (nếu có ranh giới) trước khi tốn 1 request Nominatim
+                inside = boundary_in_area(info["lat"], info["lng"], task.district, task.province)
+                if inside is False:
+                    print(f"{task.tag}   → [SKIP-OUT] {short_name} | ({info['lat']},{info['lng']}) ngoài ranh giới {task.district}, {task.province}")
+                    continue
+
+                # Địa chỉ chi tiết: card từ response tìm kiếm (CARD_EXTRACTOR = "network") có sẵn, khỏi gọi Nominatim
+                addr = info.get("address") or reverse_geocode(info["lat"], info["lng"], place_id=info["place_id"])
+
+                # Lọc địa bàn theo 4 trường hợp (và biến thể viết tắt/quận/tx/tp) khi không có ranh giới
+                if inside is None and not in_target_area(addr, task.district, task.province):
+                    addr_short = (addr[:70] + '...') if addr and len(addr) > 70 else (addr or 'None')
+                    print(f"{task.tag}   → [SKIP-OUT] {short_name} | Addr={addr_short} | NOT IN: {task.district}, {task.province}")
+                    continue
+
+                store_data = {
+                    'province': task.province,
+                    'district': task.district,
+                    'place_id': info["place_id"],
+                    'name': info["name"],
+                    'image': info["image"],
+                    'rating': info["rating"],
+                    'category': info["category"],
+                    'status': info["status"],
+                    'closing_time': info["closing_time"],
+                    'phone': info["phone"],
+                    'latitude': float(info["lat"]),
+                    'longitude': float(info["lng"]),
+                    'address': addr,
+                    'map_url': info["map_url"],
+                    'created_at': datetime.now(),
+                    'rating_value': info["rating_value"],
+                    'review_count': info["review_count"],
+                    'phone_e164': info["phone_e164"],
+                    'open_status': info["open_status"],
+                }
+                self.save_q.put((task, store_data, short_name))
+            except Exception as e:
+                print(f"{task.tag}   → [ERROR] {short_name} :: {e}")
+
+    # ---------- Stage persist ----------
+
+    def _persist_stage(self):
+        cur, conn = self._cur, self._conn
+        writer = self._writer = StoreWriter(cur, conn)
+        current = None   # task đang có bản ghi trong writer (writer luôn được flush ở cuối mỗi task)
+        while True:
+            try:
+                item = self.save_q.get(timeout=1)
+            except queue.Empty:
+                if current is not None and writer.due():
+                    self._flush(current)
+                continue
+            if item is _STOP:
+                return
+
+            if isinstance(item, _TaskEnd):
+                self._finish_task(item.task)
+                current = None
+                continue
+
+            if isinstance(item, _Checkpoint):
+                item.task.pending_checkpoint = item.place_id
+                if not len(writer):
+                    self._write_checkpoint(item.task)   # không có bản ghi chờ: card trước mốc đã bền
+                continue
+
+            task, store_data, _ = item
+            task.processed += 1
+            current = task
+            if writer.add(store_data) or writer.due():
+                self._flush(task)
+
+    def _flush(self, task):
+        n = len(self._writer)
+        if not n:
+            return
+        try:
+            counts = self._writer.flush()
+        except Exception as e:
+            # cả lô bị rollback → đánh dấu task 'partial' để lần sau crawl lại
+            task.failed = task.broken = True
+            print(f"{task.tag}[ERROR] Ghi lô {n} bản ghi lỗi @ {task}: {e}")
+            return
+        if task.seen is not None:
+            task.seen.remember(self._writer.flushed)
+        task.saved += counts["inserted"] + counts["updated"]
+        task.unchanged += counts["unchanged"]
+        self.saved_total += counts["inserted"] + counts["updated"]
+        print(f"{task.tag}   → [FLUSH] {n} bản ghi: {counts['inserted']} mới, "
+              f"{counts['updated']} cập nhật, {counts['unchanged']} không đổi")
+        self._write_checkpoint(task)
+
+    def _refresh_known(self, task):
+        """UPDATE lô card đã biết có trường đổi (SEEN-CHANGED) đã gom tới giờ; lỗi thì task không tiến checkpoint nữa."""
+        n = len(task.refresh_rows)   # stage parse có thể đang append thêm: chỉ lấy phần đã có
+        if not n:
+            return
+        rows = task.refresh_rows[:n]
+        del task.refresh_rows[:n]
+        try:
+            task.refreshed += refresh_store_fields(self._cur, self._conn, rows)
+        except Exception as e:
+            self._conn.rollback()
+            task.failed = task.broken = True
+            print(f"{task.tag}[ERROR] Refresh lô {n} card đã biết lỗi: {e}")
+            return
+        if task.seen is not None:
+            task.seen.remember(rows)
+
+    def _write_checkpoint(self, task):
+        """
+        Ghi last_place_id; bỏ qua nếu task đã có lô ghi lỗi (checkpoint không được vượt qua dòng bị mất).
+        Refresh card đã biết trước mốc được ghi trước, không thì resume sẽ bỏ qua chúng.
+        """
+        pid, task.pending_checkpoint = task.pending_checkpoint, None
+        if not pid or task.lost or pid == task.checkpoint:
+            return
+        self._refresh_known(task)
+        if task.broken:
+            return
+        try:
+            task.save_checkpoint(self._cur, self._conn, pid)
+        except Exception as e:
+            self._conn.rollback()
+            print(f"{task.tag}[WARN] Không ghi được checkpoint @ {task}: {e}")
+
+    def _finish_task(self, task):
+        with self._live_lock:
+            self._live.pop(task, None)
+        self._flush(task)
+        self._refresh_known(task)
+
+        print(f"{task.tag}[INFO] Lưu mới {task.saved}/{task.total_cards} mục @ {task.district}, {task.province} "
+              f"(không đổi {task.unchanged}, đã biết {task.skipped_seen}, refresh {task.refreshed}, "
+              f"loại bbox {task.rejected_bbox}, resume bỏ qua {task.resumed_skip})")
+        if task.lost:
+            return
+        try:
+            task.mark(self._cur, self._conn, 'partial' if task.failed else 'done')
+        except Exception as e:
+            self._conn.rollback()
+            print(f"{task.tag}[ERROR] Không ghi được progress @ {task}: {e}")
@@ -1,5 +1,18 @@
 # progress.py
 # Quản lý tiến trình crawl theo (province, district, keyword)
+#
+# Chạy nhiều máy cùng lúc: mỗi worker "claim" 1 combo bằng lease (worker_id + lease_until).
+#   - progress_claim:  lấy 1 combo pending/partial/failed hoặc 'running' đã hết lease (FOR UPDATE SKIP LOCKED)
+#   - progress_heartbeat: gia hạn lease trong lúc đang crawl
+#   - progress_release: trả combo về với trạng thái cuối (done/partial/failed)
+#   - progress_checkpoint: ghi last_place_id giữa feed để resume không làm lại card đã xong
+# Worker chết → lease hết hạn → máy khác tự claim lại.
+# Combo claim quá LEASE_MAX_ATTEMPTS lần mà chưa 'done' bị bỏ qua (progress_exhausted để báo,
+# progress_requeue_exhausted để đưa về 'pending'); 'done' hoặc đưa về 'pending' thì đếm lại attempts từ 0.
+
+import psycopg2.extras
+from dbpool import execute_prepared
+from config import LEASE_SECONDS, LEASE_MAX_ATTEMPTS
 
 def progress_get(cur, province, district, keyword):
     cur.execute("""
@@ -10,12 +23,149 @@ def progress_get(cur, province, district, keyword):
     return cur.fetchone()
 
 def progress_upsert(cur, conn, province, district, keyword, status, last_place_id=None):
-    cur.execute("""
-        INSERT INTO crawl_progress (province, district, keyword, status, last_place_id, updated_at)
-        VALUES (%s, %s, %s, %s, %s, NOW())
+    # 'running' ở chế độ tuần tự cũng giữ lease để worker phân tán không giành mất (Task.beat gia hạn)
+    execute_prepared(cur, "cp_upsert", """
+        INSERT INTO crawl_progress (province, district, keyword, status, last_place_id, updated_at,
+                                    lease_until)
+        VALUES (%s, %s, %s, %s, %s, NOW(),
+                CASE WHEN %s = 'running' THEN NOW() + make_interval(secs => %s) END)
         ON CONFLICT (province, district, keyword) DO UPDATE
           SET status = EXCLUDED.status,
-              last_place_id = EXCLUDED.last_place_id,
+              -- giữ checkpoint giữa feed khi không truyền mới; 'done' thì xoá
+              last_place_id = CASE WHEN EXCLUDED.status = 'done' THEN NULL
+                                   ELSE COALESCE(EXCLUDED.last_place_id, crawl_progress.last_place_id) END,
+              lease_until = EXCLUDED.lease_until,
+              worker_id = NULL,
+              attempts = CASE WHEN EXCLUDED.status IN ('done', 'pending') THEN 0 ELSE crawl_progress.attempts END,
               updated_at = NOW();
-    """, (province, district, keyword, status, last_place_id))
+    """, (province, district, keyword, status, last_place_id, status, LEASE_SECONDS))
+    conn.commit()
+
+# ========= Lease / claim cho crawl phân tán =========
+
+def progress_seed(cur, conn, tasks):
+    """Tạo sẵn dòng 'pending' cho các combo chưa có (không đụng dòng đã tồn tại)."""
+    rows = psycopg2.extras.execute_values(cur, """
+        INSERT INTO crawl_progress (province, district, keyword, status)
+        VALUES %s
+        ON CONFLICT (province, district, keyword) DO NOTHING
+        RETURNING 1;
+    """, [(p, d, k, 'pending') for p, d, k in tasks], page_size=1000, fetch=True)
+    conn.commit()
+    return len(rows)
+
+def progress_reclaim_expired(cur, conn):
+    """Đưa các combo 'running' đã hết lease (worker chết) về 'partial'. Trả về số dòng."""
+    cur.execute("""
+        UPDATE crawl_progress
+        SET status = 'partial', worker_id = NULL, lease_until = NULL, updated_at = NOW()
+        WHERE status = 'running'
+          AND (lease_until IS NULL OR lease_until < NOW());
+    """)
+    conn.commit()
+    return cur.rowcount
+
+def progress_claim(cur, conn, worker_id, lease_seconds=LEASE_SECONDS, max_attempts=LEASE_MAX_ATTEMPTS):
+    """
+    Claim nguyên tử 1 combo cho worker_id. Trả về dict (province, district, keyword,
+    last_place_id, attempts) hoặc None nếu hết việc.
+    SKIP LOCKED để nhiều máy claim song song mà không chờ nhau / không lấy trùng.
+    """
+    cur.execute("""
+        WITH next AS (
+            SELECT province, district, keyword
+            FROM crawl_progress
+            WHERE (status IN ('pending', 'partial', 'failed')
+                   OR (status = 'running' AND (lease_until IS NULL OR lease_until < NOW())))
+              AND attempts < %s
+            ORDER BY province, district, keyword
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE crawl_progress c
+        SET status = 'running',
+            worker_id = %s,
+            lease_until = NOW() + make_interval(secs => %s),
+            heartbeat_at = NOW(),
+            attempts = c.attempts + 1,
+            updated_at = NOW()
+        FROM next
+        WHERE c.province = next.province
+          AND c.district = next.district
+          AND c.keyword  = next.keyword
+        RETURNING c.province, c.district, c.keyword, c.last_place_id, c.attempts;
+    """, (max_attempts, worker_id, lease_seconds))
+    row = cur.fetchone()
+    conn.commit()
+    return row
+
+def progress_exhausted(cur, max_attempts=LEASE_MAX_ATTEMPTS, limit=10):
+    """(số combo chưa 'done' đã claim >= max_attempts lần, vài dòng mẫu) — progress_claim bỏ qua các combo này."""
+    cur.execute("""
+        SELECT province, district, keyword, status, attempts, COUNT(*) OVER () AS total
+        FROM crawl_progress
+        WHERE status <> 'done' AND attempts >= %s
+        ORDER BY province, district, keyword
+        LIMIT %s;
+    """, (max_attempts, limit))
+    rows = cur.fetchall()
+    cur.connection.commit()
+    return (rows[0]['total'] if rows else 0), rows
+
+def progress_requeue_exhausted(cur, conn, max_attempts=LEASE_MAX_ATTEMPTS):
+    """Đưa các combo đã hết lượt claim về 'pending', đếm lại attempts (giữ checkpoint). Trả về số dòng."""
+    cur.execute("""
+        UPDATE crawl_progress
+        SET status = 'pending', attempts = 0, worker_id = NULL, lease_until = NULL, updated_at = NOW()
+        WHERE status <> 'done' AND attempts >= %s
+          AND NOT (status = 'running' AND lease_until > NOW());
+    """, (max_attempts,))
+    conn.commit()
+    return cur.rowcount
+
+def progress_heartbeat(cur, conn, province, district, keyword, worker_id=None, lease_seconds=LEASE_SECONDS):
+    """
+    Gia hạn lease. Trả về False nếu lease đã mất (bị worker khác reclaim).
+    worker_id=None: lease 'running' của chế độ tuần tự / hàng đợi (progress_upsert).
+    """
+    execute_prepared(cur, "cp_heartbeat", """
+        UPDATE crawl_progress
+        SET lease_until = NOW() + make_interval(secs => %s),
+            heartbeat_at = NOW()
+        WHERE province=%s AND district=%s AND keyword=%s
+          AND worker_id IS NOT DISTINCT FROM %s AND status = 'running';
+    """, (lease_seconds, province, district, keyword, worker_id))
+    conn.commit()
+    return cur.rowcount > 0
+
+def progress_release(cur, conn, province, district, keyword, worker_id, status, last_place_id=None):
+    """Ghi trạng thái cuối và bỏ lease. Chỉ có tác dụng nếu worker_id còn giữ lease."""
+    execute_prepared(cur, "cp_release", """
+        UPDATE crawl_progress
+        SET status = %s,
+            last_place_id = CASE WHEN %s = 'done' THEN NULL ELSE COALESCE(%s, last_place_id) END,
+            attempts = CASE WHEN %s = 'done' THEN 0 ELSE attempts END,
+            worker_id = NULL,
+            lease_until = NULL,
+            updated_at = NOW()
+        WHERE province=%s AND district=%s AND keyword=%s
+          AND worker_id = %s;
+    """, (status, status, last_place_id, status, province, district, keyword, worker_id))
+    conn.commit()
+    return cur.rowcount > 0
+
+def progress_checkpoint(cur, conn, province, district, keyword, last_place_id, worker_id=None):
+    """
+    Ghi checkpoint giữa feed: mọi card tới hết last_place_id (theo thứ tự feed) đã xử lý xong.
+    Chế độ phân tán chỉ ghi khi worker_id còn giữ lease. Trả về False nếu không ghi được.
+    """
+    execute_prepared(cur, "cp_checkpoint", """
+        UPDATE crawl_progress
+        SET last_place_id = %s,
+            updated_at = NOW()
+        WHERE province=%s AND district=%s AND keyword=%s
+          AND status = 'running'
+          AND worker_id IS NOT DISTINCT FROM %s;
+    """, (last_place_id, province, district, keyword, worker_id))
     conn.commit()
+    return cur.rowcount > 0
@@ -1,316 +1,441 @@
 
 import time
-import random
-import re
-import unicodedata
-from datetime import datetime
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.keys import Keys
+import os
+import socket
+import argparse
+import multiprocessing as mp
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 
 from config import (
     PROVINCE_DISTRICTS, KEYWORDS,
-    SELENIUM_HEADLESS, SELENIUM_USER_AGENT
+    SELENIUM_HEADLESS, SELENIUM_USER_AGENT, SELENIUM_LEAN, SELENIUM_BLOCK_URLS, SELENIUM_WINDOW_SIZE,
+    SELENIUM_DISABLE_WEBGL,
+    SCRAPER_WORKERS, WORKER_START_STAGGER, GEOCODE_WARM_FROM_STORES, SCROLL_SUBMIT_EVERY_CARDS,
+    CARD_EXTRACTOR
 )
-from db import connect_postgres, ensure_tables, save_store
-from progress import progress_get, progress_upsert
-from geocode import reverse_geocode
+from db import connect_postgres, release_postgres, ensure_tables
+from progress import (
+    progress_get, progress_upsert, progress_seed, progress_claim, progress_reclaim_expired,
+    progress_exhausted, progress_requeue_exhausted
+)
+from geocode import configure_shared_rate_limit, evict_expired, cache_stats, warm_from_stores
 from scroll import scroll_to_list_bottom
-from parser import parse_business_card
+from extract import CardStream, NetworkCardStream, EXTRACT_JSON, EXTRACT_NETWORK
+from netcapture import enable_performance_log
+from navigate import open_search, record as record_nav, nav_stats
+from pacing import policy, wait_search_ready, PhaseTimer
+from filters import in_target_area  # giữ scraper.in_target_area như cũ
+from classifier import is_excluded_by_name_or_category  # giữ scraper.is_excluded_by_name_or_category như cũ
+from pipeline import Pipeline, Task, LeaseLost
 
 
-# ========= Helpers lọc địa bàn (4 trường hợp, có quận/huyện/tx/tp và viết tắt) =========
+# ========= Selenium driver =========
 
-_PFX_DIST = [
-    "huyện", "quận", "thị xã", "thi xa", "thành phố", "thanh pho",
-    "h.", "q.", "tx.", "tp.", "h", "q", "tx", "tp"
-]
-_PFX_PROV = ["tỉnh", "tinh", "thành phố", "thanh pho", "tp.", "tp"]
+def build_driver(driver_path=None):
+    """
+    Tạo 1 Chrome. `driver_path` cho phép dùng lại chromedriver đã cài sẵn
+    (chế độ nhiều worker cài 1 lần ở tiến trình cha để tránh tải trùng).
+    SELENIUM_LEAN: hồ sơ gọn (chặn ảnh/tile/font/media, tắt tính năng thừa) để 1 máy chạy được nhiều worker hơn.
+    CARD_EXTRACTOR = "network": bật performance log để đọc response tìm kiếm (netcapture.py).
+    """
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    options.add_argument('--disable-gpu')
+    options.add_argument(f'user-agent={SELENIUM_USER_AGENT}')
+    if SELENIUM_HEADLESS:
+        options.add_argument('--headless=new')
+    if SELENIUM_LEAN:
+        _lean_options(options)
+    if CARD_EXTRACTOR == EXTRACT_NETWORK:
+        enable_performance_log(options)
+    driver = webdriver.Chrome(service=Service(driver_path or ChromeDriverManager().install()), options=options)
+    if SELENIUM_LEAN:
+        _block_resources(driver)
+    return driver
 
-def _strip_accents(s: str) -> str:
-    if not s:
-        return ""
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    return s
 
-def _norm(s: str) -> str:
-    s = _strip_accents(s or "").lower()
-    s = re.sub(r"[^\w\s]", " ", s)      # bỏ dấu câu
-    s = re.sub(r"\s+", " ", s).strip()  # chuẩn hoá khoảng trắng
-    return s
+def _lean_options(options):
+    options.add_argument(f'--window-size={SELENIUM_WINDOW_SIZE}')
+    for arg in ('--disable-extensions', '--disable-background-networking', '--disable-sync',
+                '--disable-default-apps', '--disable-notifications', '--no-first-run',
+                '--mute-audio', '--disable-dev-shm-usage', '--autoplay-policy=user-gesture-required'):
+        options.add_argument(arg)
+    if SELENIUM_DISABLE_WEBGL:
+        options.add_argument('--disable-3d-apis')
 
-def _remove_leading_prefix(s: str, prefixes) -> str:
-    """
-    Bỏ các tiền tố hành chính đứng đầu, ví dụ:
-    'huyện ba vì' -> 'ba vì', 'quận tây hồ' -> 'tây hồ', 'tp. ha noi' -> 'ha noi'
-    """
-    ns = _norm(s)
-    for p in sorted(prefixes, key=len, reverse=True):
-        p_norm = _norm(p)
-        if ns.startswith(p_norm + " "):
-            return ns[len(p_norm):].strip()
-    return ns
-
-def _mk_district_variants(district: str):
-    """
-    Sinh các biến thể cho district:
-    - nguyên văn (chuẩn hoá): 'huyen ba vi', 'quan ba dinh', ...
-    - chỉ tên trần: 'ba vi', 'ba dinh'
-    - viết tắt có tiền tố: 'h ba vi', 'h. ba vi', 'q ba dinh', 'q. ba dinh', 'tx son tay', 'tp thu duc'
-    """
-    ns_full = _norm(district)
-    bare = _remove_leading_prefix(district, _PFX_DIST)
 
-    variants = set()
-    variants.add(ns_full)
-    variants.add(bare)
+def _block_resources(driver):
+    """Chặn request theo SELENIUM_BLOCK_URLS (áp cho mọi trang của phiên); lỗi CDP thì chạy không chặn."""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(SELENIUM_BLOCK_URLS)})
+    except WebDriverException as e:
+        print(f"[WARN] Không chặn được resource qua CDP: {e}")
 
-    # thêm dạng viết tắt/tiền tố rút gọn phổ biến
-    for p in ["huyen", "h.", "h", "quan", "q.", "q", "thi xa", "tx.", "tx", "thanh pho", "tp.", "tp"]:
-        variants.add(f"{p} {bare}")
 
-    return {v.strip() for v in variants if v.strip()}
+# ========= 1 task = 1 combo (province, district, keyword) =========
 
-def _mk_province_variants(province: str):
-    """
-    Sinh các biến thể cho province:
-    - nguyên văn: 'thanh pho ha noi', 'tinh bac ninh'...
-    - rút gọn bỏ tiền tố: 'ha noi', 'bac ninh'
-    - viết tắt phổ biến: 'tp ha noi', 'tp. ha noi'
-    """
-    ns_full = _norm(province)
-    bare = _remove_leading_prefix(province, _PFX_PROV)
+def iter_tasks():
+    """Sinh toàn bộ combo theo đúng thứ tự crawl tuần tự."""
+    for province, districts in PROVINCE_DISTRICTS.items():
+        for district in districts:
+            for keyword in KEYWORDS:
+                yield province, district, keyword
 
-    variants = set()
-    variants.add(ns_full)
-    variants.add(bare)
-    for p in ["thanh pho", "tp.", "tp", "tinh"]:
-        variants.add(f"{p} {bare}")
 
-    return {v.strip() for v in variants if v.strip()}
+def _submit_new_cards(pipeline, task, stream, final=False):
+    """Đẩy các card mới xuất hiện trong feed (stream theo place_id) vào pipeline."""
+    cards, n = stream.poll(final=final)
+    if not (n or final):
+        return
+    if stream.mode == EXTRACT_JSON:
+        pipeline.submit_cards(task, cards, final=final)
+    else:
+        pipeline.submit_page(task, cards, final=final)
 
-def in_target_area(addr: str, district: str, province: str) -> bool:
+
+def crawl_task(driver, pg_cur, pg_conn, pipeline, province, district, keyword, tag="", worker_id=None,
+               resume_after=None):
     """
-    NHẸ TAY: Chỉ cần KHỚP MỘT trong hai:
-      - addr chứa 1 biến thể của district (quận/huyện/thị xã/thành phố, viết tắt…)
-      - HOẶC addr chứa 1 biến thể của province (tỉnh/thành phố, viết tắt…)
+    Stage browse của 1 combo: resume check → tìm kiếm → cuộn, vừa cuộn vừa đẩy card mới vào pipeline.
+    parse → geocode → lưu → checkpoint → progress 'done' chạy nền trong pipeline, browser đi tiếp ngay.
+    Trả về Task; None nếu bỏ qua vì đã 'done'.
 
-    Nghĩa là chỉ cần có 'Ba Vì' HOẶC có 'Hà Nội' (kể cả các biến thể như 'Q.', 'TP.', 'Thành phố'…)
-    là pass bộ lọc.
+    worker_id != None: combo đã được claim qua progress_claim (chế độ phân tán),
+    mọi ghi tiến trình đi qua lease của worker và có heartbeat định kỳ.
+    resume_after: last_place_id (checkpoint) của lần chạy dở; chế độ thường tự đọc từ crawl_progress.
     """
-    if not addr:
-        return False
+    if not worker_id:
+        # Resume tiến trình
+        pg = progress_get(pg_cur, province, district, keyword)
+        if pg and pg['status'] == 'done':
+            print(f"{tag}[SKIP] Done rồi: {keyword} @ {district}, {province}")
+            return None
+        if pg and pg['status'] in ('running', 'partial'):
+            resume_after = pg['last_place_id']
+        progress_upsert(pg_cur, pg_conn, province, district, keyword, status='running')
+
+    task = Task(province, district, keyword, tag=tag, worker_id=worker_id, resume_after=resume_after)
+    if resume_after:
+        print(f"{tag}[RESUME] Checkpoint {resume_after} @ {district}, {province}")
+
+    pipeline.attach_seen(task, pg_cur)
+    try:
+        _browse(driver, pg_cur, pg_conn, pipeline, task)
+    except BaseException:
+        # Chrome chết / mất lease / Ctrl+C giữa chừng: card đã đẩy vẫn được lưu + checkpoint,
+        # pipeline kết thúc task 'partial' để lần sau resume từ checkpoint
+        task.failed = True
+        pipeline.submit_page(task, "", final=True)
+        raise
+    return task
+
+
+def _browse(driver, pg_cur, pg_conn, pipeline, task):
+    """Tìm kiếm + cuộn feed của task; card mới được đẩy vào pipeline theo từng đợt."""
+    tag, province, district, keyword = task.tag, task.province, task.district, task.keyword
+    print(f"{tag}===== Tìm: {keyword} {district}, {province} =====")
+    search_query = f"{keyword} {district} {province}"
+
+    pol = policy()
+    timer = PhaseTimer()
+    pol.before_search()
+    timer.lap("chờ lịch")
+
+    # mode "network" phải bắt đầu nghe trước khi điều hướng để không lỡ response trang đầu
+    stream = NetworkCardStream(driver) if CARD_EXTRACTOR == EXTRACT_NETWORK else CardStream(driver, CARD_EXTRACTOR)
+    t0 = time.perf_counter()
+    try:
+        used = open_search(driver, search_query)
+        print(f"{tag}[DEBUG] Đã tìm ({used}): {search_query}")
+    except Exception as e:
+        print(f"{tag}[ERROR] Không tìm kiếm được: {e}")
+        task.mark(pg_cur, pg_conn, 'failed')
+        return
+
+    # chờ kết quả load: có feed / CAPTCHA / trang 1 địa điểm
+    state = wait_search_ready(driver)
+    if state == 'captcha':
+        print(f"{tag}[STOP] CAPTCHA @ {district}, {province} -> partial")
+        pol.on_captcha()
+        task.mark(pg_cur, pg_conn, 'partial')
+        return
+    if state != 'feed':
+        print(f"{tag}[DEBUG] Không thấy feed @ {district}, {province}: {state or 'hết thời gian chờ'}")
+        task.mark(pg_cur, pg_conn, 'failed')
+        return
+    feed = driver.find_element(By.CSS_SELECTOR, 'div[role="feed"]')
+    pol.on_success()
+    nav_secs = time.perf_counter() - t0
+    record_nav(used, nav_secs)
+    timer.lap("tìm")
+
+    # cuộn đến đáy; cứ thêm SCROLL_SUBMIT_EVERY_CARDS card thì đẩy luôn card mới vào pipeline
+    # (parse/geocode/lưu chạy nền, chặn ở đây nếu pipeline đang dồn quá nhiều)
+
+    def _on_round(count):
+        if count - stream.marked >= SCROLL_SUBMIT_EVERY_CARDS:
+            _submit_new_cards(pipeline, task, stream)
+            task.beat(pg_cur, pg_conn)
+
+    task.beat(pg_cur, pg_conn)
+    rounds = scroll_to_list_bottom(driver, feed, on_round=_on_round, policy=pol)
+    timer.lap(f"cuộn {rounds} vòng")
+    task.beat(pg_cur, pg_conn)
+    _submit_new_cards(pipeline, task, stream, final=True)
+    timer.lap("đẩy")
+    source = f", {stream.from_network} từ XHR" if CARD_EXTRACTOR == EXTRACT_NETWORK else ""
+    print(f"{tag}[TIME] {timer.line()} ({used}, {stream.count} card{source})")
+    if stream.duplicates:
+        print(f"{tag}[DEBUG] Bỏ {stream.duplicates} card trùng place_id trong feed @ {district}, {province}")
+
+
+def _close_pipeline(pipeline, tag=""):
+    pages, cards, saves = pipeline.backlog()
+    if pages or cards or saves:
+        print(f"{tag}[INFO] Đang xả pipeline: {pages} trang, {cards} card chờ geocode, {saves} card chờ lưu...")
+    try:
+        pipeline.close()
+    except KeyboardInterrupt:
+        print(f"{tag}[EXIT] Bỏ ngang pipeline — các combo chưa xong vẫn ở 'running', sẽ resume.")
 
-    addr_norm = _norm(addr)
-    dvars = _mk_district_variants(district)
-    pvars = _mk_province_variants(province)
 
-    has_d = any(v in addr_norm for v in dvars)
-    has_p = any(v in addr_norm for v in pvars)
+def _evict_geocode_cache():
+    evicted = evict_expired()
+    if evicted:
+        print(f"[INFO] Xoá {evicted} địa chỉ geocode quá hạn khỏi cache.")
 
-    # ĐIỂM KHÁC BIỆT: chỉ cần 1 trong 2 là True
-    return has_d or has_p
 
+def _warm_geocode_cache(pg_cur, tag=""):
+    if not GEOCODE_WARM_FROM_STORES:
+        return
+    try:
+        n = warm_from_stores(pg_cur)
+        print(f"{tag}[INFO] Nạp sẵn {n} địa chỉ từ grocery_stores vào cache geocode.")
+    except Exception as e:
+        pg_cur.connection.rollback()
+        print(f"{tag}[WARN] Không nạp được cache geocode từ grocery_stores: {e}")
 
-# =============== Bộ lọc loại trừ “đông y/nam dược/cổ truyền/thú y” ===============
 
-EXCLUDE_KEYWORDS = [
-    "đông y", "nam dược", "cổ truyền", "y học cổ truyền",
-    "thuốc bắc", "thú y", "thú y viện", "pet", "veterinary","thuốc nam", "dong y", "nam duoc", "co truyen", "y hoc co truyen",
-    "thuoc bac", "thu y", "thu y vien", "thuy vien", "thuoc nam"
-]
+def _geocode_stats_line():
+    st = cache_stats()
+    return (f"Geocode: {st['mem_hits']} hit RAM, {st['place_hits']} hit theo place_id, "
+            f"{st['store_hits']} hit cache bền, {st['misses']} gọi Nominatim")
 
-def _contains_any(text: str, terms) -> bool:
-    """So khớp không dấu + lowercase để bắt cả 'dong y', 'thu y'..."""
-    t = _norm(text or "")
-    for k in terms:
-        if _norm(k) in t:
-            return True
-    return False
 
-def is_excluded_by_name_or_category(info: dict) -> bool:
-    """
-    Loại trừ nếu tên hoặc category có chứa từ khóa không mong muốn.
-    - Dùng khi parser trả category từ hàm categorize(name) hoặc để trống.
-    """
-    name = info.get("name") or ""
-    cat  = info.get("category") or ""
-    blob = f"{name} {cat}"
-    # Nếu parser đã phân loại "Loại trừ" thì cũng bỏ luôn
-    if (cat.strip().lower() == "loại trừ"):
-        return True
-    return _contains_any(blob, EXCLUDE_KEYWORDS)
+def _nav_stats_line():
+    st = nav_stats()
+    if not st:
+        return "Điều hướng: chưa có query"
+    return "Điều hướng: " + ", ".join(f"{mode} {n} query, {avg:.1f}s/query" for mode, (n, avg) in st.items())
 
 
-# ========= Selenium driver =========
+def _print_summary(pg_cur):
+    try:
+        pg_cur.execute("SELECT COUNT(*) FROM grocery_stores;")
+        total_in_db = pg_cur.fetchone()[0]
+    except Exception:
+        total_in_db = 'N/A'
 
-def build_driver():
-    options = webdriver.ChromeOptions()
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    options.add_argument('--disable-gpu')
-    options.add_argument(f'user-agent={SELENIUM_USER_AGENT}')
-    if SELENIUM_HEADLESS:
-        options.add_argument('--headless=new')
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    return driver
+    print("\n===== KẾT QUẢ =====")
+    print(f"Tổng trong DB: {total_in_db}")
+    print(_geocode_stats_line())
+    print(_nav_stats_line())
 
 
-def main():
-    total_new = 0
-    total_dup = 0
+# ========= Chạy tuần tự (1 Chrome) =========
 
+def run_serial():
     pg_conn, pg_cur = connect_postgres()
     ensure_tables(pg_cur, pg_conn)
+    _evict_geocode_cache()
+    _warm_geocode_cache(pg_cur)
 
     driver = build_driver()
+    pipeline = Pipeline()
 
     try:
-        for province, districts in PROVINCE_DISTRICTS.items():
-            for district in districts:
-                for keyword in KEYWORDS:
-
-                    # Resume tiến trình
-                    pg = progress_get(pg_cur, province, district, keyword)
-                    if pg and pg['status'] == 'done':
-                        print(f"[SKIP] Done rồi: {keyword} @ {district}, {province}")
-                        continue
-                    progress_upsert(pg_cur, pg_conn, province, district, keyword, status='running')
-
-                    print(f"===== Tìm: {keyword} {district}, {province} =====")
-                    search_query = f"{keyword} {district} {province}"
-                    driver.get("https://www.google.com/maps/")
-
-                    try:
-                        search_box = WebDriverWait(driver, 15).until(
-                            EC.presence_of_element_located((By.ID, "searchboxinput"))
-                        )
-                        search_box.clear()
-                        search_box.send_keys(search_query)
-                        time.sleep(1)
-                        search_box.send_keys(Keys.ENTER)
-                        print(f"[DEBUG] Đã nhập & nhấn Enter: {search_query}")
-                    except Exception as e:
-                        print(f"[ERROR] Không tìm thấy ô tìm kiếm: {e}")
-                        progress_upsert(pg_cur, pg_conn, province, district, keyword, status='failed')
-                        continue
-
-                    # Chờ kết quả load
-                    time.sleep(random.uniform(5, 8))
-
-                    # phát hiện captcha
-                    ps = driver.page_source.lower()
-                    if ("captcha" in ps) or ("detected unusual traffic" in ps):
-                        print(f"[STOP] CAPTCHA @ {district}, {province} -> partial")
-                        progress_upsert(pg_cur, pg_conn, province, district, keyword, status='partial')
-                        continue
-
-                    # feed
-                    try:
-                        feed = WebDriverWait(driver, 12).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, 'div[role="feed"]'))
-                        )
-                    except Exception as e:
-                        print(f"[DEBUG] Không thấy feed @ {district}, {province}: {e}")
-                        progress_upsert(pg_cur, pg_conn, province, district, keyword, status='failed')
-                        continue
-
-                    # cuộn đến đáy
-                    scroll_to_list_bottom(driver, feed)
-
-                    # parse
-                    soup = BeautifulSoup(driver.page_source, 'html.parser')
-                    cards = soup.find_all('div', class_=lambda x: x and 'Nv2PK' in x)
-                    total_cards = len(cards)
-                    print(f"[DEBUG] Tổng {total_cards} kết quả @ {district}, {province}")
-
-                    saved_here = 0
-                    seen = 0
-                    for div in cards:
-                        seen += 1
-                        short_name = "N/A"
-                        try:
-                            info = parse_business_card(div)
-
-                            # Log trước khi geocode
-                            name_for_log = info.get("name") or "N/A"
-                            short_name = (name_for_log[:60] + '...') if len(name_for_log) > 60 else name_for_log
-                            print(f"[{seen:03d}/{total_cards}] Đang xử lý: {short_name} | Cat={info.get('category','')}")
-
-                            # >>> Bộ lọc loại trừ đông y/nam dược/cổ truyền/thú y
-                            if is_excluded_by_name_or_category(info):
-                                print(f"   → [SKIP-EXCLUDE] {short_name} | Cat={info.get('category','')}")
-                                continue
-
-                            # Bắt buộc có toạ độ thật (từ !3d..!4d..)
-                            if not info["lat"] or not info["lng"]:
-                                print(f"   → [SKIP-NO-COORD] {short_name}")
-                                continue
-
-                            # Địa chỉ chi tiết
-                            addr = reverse_geocode(info["lat"], info["lng"])
-
-                            # Lọc địa bàn theo 4 trường hợp (và biến thể viết tắt/quận/tx/tp)
-                            if not in_target_area(addr, district, province):
-                                addr_short = (addr[:70] + '...') if addr and len(addr) > 70 else (addr or 'None')
-                                print(f"   → [SKIP-OUT] {short_name} | Addr={addr_short} | NOT IN: {district}, {province}")
-                                continue
-
-                            store_data = {
-                                'province': province,
-                                'district': district,
-                                'place_id': info["place_id"],
-                                'name': info["name"],
-                                'image': info["image"],
-                                'rating': info["rating"],
-                                'category': info["category"],
-                                'status': info["status"],
-                                'closing_time': info["closing_time"],
-                                'phone': info["phone"],
-                                'latitude': float(info["lat"]),
-                                'longitude': float(info["lng"]),
-                                'address': addr,
-                                'map_url': info["map_url"],
-                                'created_at': datetime.now()
-                            }
-
-                            if save_store(pg_cur, pg_conn, store_data):
-                                saved_here += 1
-                                print(f"   → [SAVED] {short_name}")
-                            else:
-                                print(f"   → [DUP]   {short_name}")
-
-                        except Exception as e:
-                            print(f"   → [ERROR] {short_name} :: {e}")
-
-                    print(f"[INFO] Lưu mới {saved_here}/{total_cards} mục @ {district}, {province}")
-                    progress_upsert(pg_cur, pg_conn, province, district, keyword, status='done')
-
-                    time.sleep(random.uniform(5, 10))
+        for province, district, keyword in iter_tasks():
+            try:
+                crawl_task(driver, pg_cur, pg_conn, pipeline, province, district, keyword)
+            except LeaseLost as e:
+                # combo 'running' bị 1 lần chạy --distributed claim mất (lease hết hạn) → để bên kia làm
+                print(f"[WARN] Mất lease, bỏ task: {e}")
 
     except KeyboardInterrupt:
-        print("\n[EXIT] Ctrl+C — sẽ resume ở lần chạy sau (đánh dấu partial).")
+        print("\n[EXIT] Ctrl+C — xả nốt pipeline, phần dở sẽ resume ở lần chạy sau.")
     finally:
-        # Tổng kết
-        try:
-            pg_cur.execute("SELECT COUNT(*) FROM grocery_stores;")
-            total_in_db = pg_cur.fetchone()[0]
-        except Exception:
-            total_in_db = 'N/A'
+        driver.quit()
+        _close_pipeline(pipeline)
+        _print_summary(pg_cur)
 
-        print("\n===== KẾT QUẢ =====")
-        # Ở đây 'total_new' không tăng trực tiếp — bạn có thể cộng dồn trong save_store nếu muốn
-        print(f"Tổng trong DB: {total_in_db}")
+        release_postgres(pg_conn, pg_cur)
 
-        driver.quit()
-        pg_cur.close()
-        pg_conn.close()
+
+# ========= Chạy song song N Chrome (mỗi worker 1 tiến trình) =========
+
+def _worker_main(worker_no, task_queue, driver_path, geo_lock, geo_last, distributed=False):
+    """
+    Tiến trình con: 1 Chrome + 1 kết nối Postgres riêng.
+    - Mặc định lấy task từ hàng đợi chung cho tới khi gặp sentinel None.
+    - distributed=True: claim task trực tiếp từ crawl_progress bằng lease
+      (nhiều máy chạy chung 1 Postgres), dừng khi không còn gì để claim.
+    """
+    tag = f"[W{worker_no:02d}] "
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_no}" if distributed else None
+    configure_shared_rate_limit(geo_lock, geo_last)
+
+    pg_conn, pg_cur = connect_postgres()
+    _warm_geocode_cache(pg_cur, tag)
+    pipeline = Pipeline()
+    driver = None
+    done = 0
+
+    def _next_task():
+        if distributed:
+            row = progress_claim(pg_cur, pg_conn, worker_id)
+            return (row['province'], row['district'], row['keyword'], row['last_place_id']) if row else None
+        return task_queue.get()
+
+    try:
+        # giãn thời điểm mở Chrome để các worker không đập Google cùng lúc
+        time.sleep(worker_no * WORKER_START_STAGGER)
+        driver = build_driver(driver_path)
+
+        while True:
+            task = _next_task()
+            if task is None:
+                break
+            province, district, keyword, *rest = task
+            try:
+                if crawl_task(driver, pg_cur, pg_conn, pipeline, province, district, keyword,
+                              tag=tag, worker_id=worker_id, resume_after=rest[0] if rest else None) is not None:
+                    done += 1
+            except LeaseLost as e:
+                print(f"{tag}[WARN] Mất lease, bỏ task: {e}")
+            except WebDriverException as e:
+                # Chrome chết giữa chừng → tạo lại; pipeline lưu nốt card đã đẩy rồi đánh dấu 'partial',
+                # lần sau resume từ checkpoint
+                print(f"{tag}[ERROR] Chrome lỗi @ {district}, {province}: {e} -> tạo lại driver")
+                pg_conn.rollback()
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+                driver = build_driver(driver_path)
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        _close_pipeline(pipeline, tag)
+        print(f"{tag}[EXIT] Worker dừng sau {done} task, lưu {pipeline.saved_total} mục. {_geocode_stats_line()}. {_nav_stats_line()}")
+        release_postgres(pg_conn, pg_cur)
+
+
+def _report_exhausted(pg_cur):
+    total, rows = progress_exhausted(pg_cur)
+    if not total:
+        return
+    print(f"[WARN] {total} combo đã claim >= LEASE_MAX_ATTEMPTS lần chưa xong, bị bỏ qua "
+          f"(chạy với --requeue-exhausted để crawl lại):")
+    for r in rows:
+        print(f"   {r['keyword']} @ {r['district']}, {r['province']} ({r['status']}, {r['attempts']} lần)")
+    if total > len(rows):
+        print(f"   ... và {total - len(rows)} combo khác")
+
+
+def run_workers(n_workers, distributed=False, requeue_exhausted=False):
+    """
+    Chạy N worker độc lập (mỗi worker 1 tiến trình: Chrome + kết nối DB riêng).
+    - Tiến trình cha tạo bảng 1 lần, bỏ sẵn các combo đã 'done', đẩy phần còn lại vào Queue.
+    - Worker vẫn gọi progress_get/progress_upsert nên resume giữ nguyên như chạy tuần tự.
+    - distributed=True: không dùng Queue, seed crawl_progress rồi để worker tự claim theo lease
+      → có thể chạy lệnh này trên nhiều máy cùng trỏ về 1 Postgres.
+    - Nominatim dùng chung 1 rate limit giữa các tiến trình (trên cùng máy).
+    - Combo đã claim quá LEASE_MAX_ATTEMPTS lần được liệt kê lúc đầu và lúc cuối;
+      requeue_exhausted=True đưa chúng về 'pending' trước khi chạy.
+    """
+    pg_conn, pg_cur = connect_postgres()
+    ensure_tables(pg_cur, pg_conn)
+    _evict_geocode_cache()
+
+    task_queue = None
+    if distributed:
+        seeded = progress_seed(pg_cur, pg_conn, iter_tasks())
+        reclaimed = progress_reclaim_expired(pg_cur, pg_conn)
+        if requeue_exhausted:
+            print(f"[INFO] Đưa lại {progress_requeue_exhausted(pg_cur, pg_conn)} combo hết lượt claim về 'pending'.")
+        _report_exhausted(pg_cur)
+        print(f"[INFO] Seed {seeded} combo mới, thu hồi {reclaimed} lease hết hạn; "
+              f"chạy {n_workers} worker (claim từ crawl_progress).")
+    else:
+        pending = []
+        for province, district, keyword in iter_tasks():
+            pg = progress_get(pg_cur, province, district, keyword)
+            if pg and pg['status'] == 'done':
+                continue
+            pending.append((province, district, keyword))
+        print(f"[INFO] {len(pending)} combo cần crawl, chạy với {n_workers} worker.")
+
+        task_queue = mp.Queue()
+        for task in pending:
+            task_queue.put(task)
+        for _ in range(n_workers):
+            task_queue.put(None)
+
+    # cài chromedriver 1 lần, các worker dùng lại đường dẫn
+    driver_path = ChromeDriverManager().install()
+
+    geo_lock = mp.Lock()
+    geo_last = mp.Value('d', 0.0, lock=False)
+
+    procs = []
+    for i in range(n_workers):
+        p = mp.Process(target=_worker_main,
+                       args=(i + 1, task_queue, driver_path, geo_lock, geo_last, distributed),
+                       name=f"scraper-worker-{i + 1}")
+        p.start()
+        procs.append(p)
+
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        # Ctrl+C cũng được gửi tới các worker; chỉ cần chờ chúng đóng Chrome/DB
+        print("\n[EXIT] Ctrl+C — chờ các worker dừng, sẽ resume ở lần chạy sau.")
+        for p in procs:
+            p.join()
+    finally:
+        if distributed:
+            _report_exhausted(pg_cur)
+        _print_summary(pg_cur)
+        release_postgres(pg_conn, pg_cur)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Crawl nhà thuốc Google Maps → PostgreSQL")
+    ap.add_argument("--workers", type=int, default=SCRAPER_WORKERS,
+                    help="Số Chrome chạy song song (1 = tuần tự như cũ)")
+    ap.add_argument("--distributed", action="store_true",
+                    help="Claim combo từ crawl_progress bằng lease (chạy nhiều máy chung 1 Postgres)")
+    ap.add_argument("--requeue-exhausted", action="store_true",
+                    help="(--distributed) đưa các combo đã claim quá LEASE_MAX_ATTEMPTS lần về 'pending'")
+    args = ap.parse_args()
+
+    if args.workers <= 1 and not args.distributed:
+        run_serial()
+    else:
+        run_workers(max(args.workers, 1), distributed=args.distributed,
+                    requeue_exhausted=args.requeue_exhausted)
 
 if __name__ == "__main__":
     main()
-
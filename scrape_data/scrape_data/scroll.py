@@ -1,20 +1,72 @@
 # scroll.py
 # Hàm cuộn "bền" cho khối list (role="feed") của Google Maps
+#
+# Mỗi vòng: giãn cách theo chính sách lịch sự (pacing), rồi 1 execute_async_script cuộn + chờ ngay trong trang
+# (MutationObserver đếm card) tới khi có card mới / Google báo hết danh sách / mạng yên SCROLL_NET_IDLE_MS.
+# Gặp dòng "hết danh sách" thì dừng luôn, không đốt thêm SCROLL_PATIENCE vòng.
 
-import time
-import random
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException
-from config import SCROLL_PATIENCE, SCROLL_MAX_ROUNDS, SCROLL_WAIT_ITEM, SCROLL_GAP_MINMAX
+from config import SCROLL_PATIENCE, SCROLL_MAX_ROUNDS, SCROLL_WAIT_ITEM, SCROLL_ROUND_TIMEOUT, SCROLL_NET_IDLE_MS, \
+    WAIT_POLL_SECONDS
+import pacing
+
+# Gắn 1 lần vào feed: MutationObserver đếm card + phát hiện dòng "Bạn đã xem hết danh sách này." của Google,
+# mỗi lần hỏi chỉ đọc lại vài số thay vì find_elements toàn bộ card qua WebDriver
+_OBSERVE_JS = """
+if (!feed.__scrState) {
+  const st = {count: 0, end: false};
+  const update = () => {
+    st.count = feed.querySelectorAll('div.Nv2PK').length;
+    const tail = feed.lastElementChild ? feed.lastElementChild.textContent : '';
+    st.end = !!feed.querySelector('span.HlvSq') || /hết danh sách|end of the list/i.test(tail);
+  };
+  update();
+  new MutationObserver(update).observe(feed, {childList: true, subtree: true});
+  feed.__scrState = st;
+}
+"""
+
+# 1 vòng = 1 round-trip (execute_async_script): cuộn rồi chờ ngay trong trang tới khi có card mới / hết danh sách /
+# mạng yên / hết giờ → [số card, đã hết danh sách]
+_ROUND_JS = """
+const feed = arguments[0], prev = arguments[1], idleMs = arguments[2], timeoutMs = arguments[3];
+const done = arguments[arguments.length - 1];
+""" + _OBSERVE_JS + """
+feed.scrollTop = feed.scrollHeight;
+""" + pacing.MARK_SCROLL_JS + """
+const t0 = performance.now();
+const netIdle = () => { """ + pacing.NET_IDLE_JS + """ };
+const timer = setInterval(() => {
+  const st = feed.__scrState;
+  if (st.count > prev || st.end || netIdle() >= idleMs || performance.now() - t0 >= timeoutMs) {
+    clearInterval(timer);
+    done([st.count, st.end]);
+  }
+}, 100);
+"""
+
 
 def _count_cards(driver):
-    return len(driver.find_elements(By.CSS_SELECTOR, "div.Nv2PK"))
+    return driver.execute_script("return document.querySelectorAll('div.Nv2PK').length;")
+
+
+def _scroll_round(driver, feed_elem, prev, timeout=SCROLL_ROUND_TIMEOUT):
+    """Cuộn 1 lần và chờ trong trang; trả về (số card, đã hết danh sách)."""
+    count, end = driver.execute_async_script(_ROUND_JS, feed_elem, prev, SCROLL_NET_IDLE_MS, int(timeout * 1000))
+    return count, bool(end)
+
 
 def scroll_to_list_bottom(driver, feed_elem,
-                          patience=SCROLL_PATIENCE, max_rounds=SCROLL_MAX_ROUNDS):
+                          patience=SCROLL_PATIENCE, max_rounds=SCROLL_MAX_ROUNDS, on_round=None, policy=None):
+    """
+    Cuộn tới khi Google báo hết danh sách hoặc không thấy card mới `patience` vòng liên tiếp. Trả về số vòng đã cuộn.
+    on_round(count): gọi sau mỗi vòng với số card hiện có (để đẩy card mới đi xử lý ngay trong lúc cuộn).
+    policy: pacing.Politeness (mặc định dùng chung của tiến trình).
+    """
+    policy = policy or pacing.policy()
+
     # Chờ có item đầu tiên
-    WebDriverWait(driver, SCROLL_WAIT_ITEM).until(lambda d: _count_cards(d) > 0)
+    WebDriverWait(driver, SCROLL_WAIT_ITEM, poll_frequency=WAIT_POLL_SECONDS).until(lambda d: _count_cards(d) > 0)
 
     prev = -1
     same = 0
@@ -22,21 +74,19 @@ def scroll_to_list_bottom(driver, feed_elem,
 
     while rounds < max_rounds:
         rounds += 1
-        driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight;", feed_elem)
-
-        try:
-            WebDriverWait(driver, 3).until(lambda d: _count_cards(d) > prev)
-            curr = _count_cards(driver)
-        except TimeoutException:
-            curr = _count_cards(driver)
+        policy.scroll_gap()
+        curr, end = _scroll_round(driver, feed_elem, prev)
 
         if curr == prev:
             same += 1
         else:
             same = 0
             prev = curr
+            if on_round is not None:
+                on_round(curr)
 
+        if end:
+            break   # Google báo đã hết danh sách: không cần đợi thêm `patience` vòng
         if same >= patience:
             break
-
-        time.sleep(random.uniform(*SCROLL_GAP_MINMAX))
+    return rounds
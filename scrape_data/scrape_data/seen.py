@@ -0,0 +1,99 @@
+# seen.py
+# Tập place_id "đã biết" theo từng (tỉnh, huyện).
+#
+# 15 biến thể keyword của cùng 1 huyện trả về phần lớn là các card trùng nhau. Card đã có trong DB
+# (hoặc đã đi qua pipeline trong lần chạy này) thì không cần geocode + upsert lại toàn bộ:
+#   - không đổi gì   → bỏ qua hẳn
+#   - đổi vài trường → gom vào lô, UPDATE trước mỗi checkpoint và cuối task (db.refresh_store_fields)
+# Chỉ ghi nhận place_id khi dòng đã thực sự nằm trong grocery_stores (nạp từ DB, hoặc remember() sau khi
+# persist flush / refresh thành công) → card bị loại / geocode lỗi / lô ghi lỗi vẫn được xử lý lại ở keyword sau.
+
+from collections import OrderedDict
+from db import load_district_cards
+from normalize import na_to_none, parse_rating, normalize_phone, parse_open_status, UNKNOWN
+
+# Các trường lấy từ card (không cần geocode): đọc từ DB + ghi khi refresh
+CARD_FIELDS = (
+    "name", "image", "rating", "category", "status", "closing_time", "phone", "map_url",
+    "rating_value", "review_count", "phone_e164", "open_status",
+)
+
+
+def card_snapshot(info):
+    """
+    Các trường đã chuẩn hoá dùng để so khác biệt. Không so text thô (rating '4,6' / '4.6', số điện thoại
+    có/không dấu cách, 'N/A' của dòng chưa backfill...) mà so cột có kiểu; dòng cũ chưa có cột có kiểu
+    thì suy ra từ cột text như normalize.py.
+    """
+    open_status = info.get("open_status")
+    if open_status in (None, UNKNOWN):
+        open_status = parse_open_status(info.get("status"))
+    return (
+        na_to_none(info.get("name")),
+        na_to_none(info.get("category")),
+        na_to_none(info.get("image")),
+        info.get("rating_value") if info.get("rating_value") is not None else parse_rating(info.get("rating")),
+        info.get("review_count"),
+        info.get("phone_e164") or normalize_phone(info.get("phone")),
+        open_status,
+    )
+
+
+class DistrictSeen:
+    """place_id -> snapshot các trường card của 1 huyện."""
+
+    def __init__(self, province, district, snapshots):
+        self.province = province
+        self.district = district
+        self._snap = snapshots
+
+    def __len__(self):
+        return len(self._snap)
+
+    def check(self, info):
+        """
+        Trả về:
+          None  — place_id chưa có trong DB, cần đi tiếp geocode + lưu
+          {}    — đã biết, không đổi gì
+          {...} — đã biết, dict đầy đủ các trường card cần refresh (có place_id)
+        Chỉ đọc; ghi nhận qua remember().
+        """
+        pid = info.get("place_id")
+        if not pid or pid == 'N/A':
+            return None
+        new = card_snapshot(info)
+        old = self._snap.get(pid)
+        if old is None:
+            return None
+        if old == new:
+            return {}
+        row = {f: info.get(f) for f in CARD_FIELDS}
+        row["place_id"] = pid
+        return row
+
+    def remember(self, rows):
+        """Ghi nhận các dòng đã được ghi vào grocery_stores (dict có place_id + CARD_FIELDS)."""
+        for row in rows:
+            self._snap[row["place_id"]] = card_snapshot(row)
+
+
+class SeenRegistry:
+    """Giữ seen-set của vài huyện gần nhất (các keyword cùng huyện thường chạy liền nhau)."""
+
+    def __init__(self, max_districts=4):
+        self.max_districts = max_districts
+        self._by_district = OrderedDict()
+
+    def get(self, cur, province, district):
+        key = (province, district)
+        seen = self._by_district.get(key)
+        if seen is None:
+            rows = load_district_cards(cur, province, district, CARD_FIELDS)
+            snaps = {pid: card_snapshot(dict(zip(CARD_FIELDS, row))) for pid, row in rows.items()}
+            seen = DistrictSeen(province, district, snaps)
+            self._by_district[key] = seen
+            while len(self._by_district) > self.max_districts:
+                self._by_district.popitem(last=False)
+        else:
+            self._by_district.move_to_end(key)
+        return seen
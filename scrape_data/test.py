@@ -18,12 +18,13 @@ import sys
 import traceback
 
 # ================== CẤU HÌNH POSTGRES ==================
-PG_DSN = "host=localhost port=5432 dbname=gisdb user=postgres password=12345"
+# Dùng chung pool + DSN (DATABASE_URL / PG* / config.PG_DSN) với scraper: scrape_data/dbpool.py
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrape_data"))
+import dbpool
 
 def connect_postgres():
-    conn = psycopg2.connect(PG_DSN)
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    return conn, cur
+    return dbpool.connect()
 
 def ensure_tables(cur, conn):
     # Bảng dữ liệu
@@ -407,8 +408,7 @@ def main():
         print(f"Tổng số bản ghi trong database: {total_in_db}")
 
         driver.quit()
-        pg_cur.close()
-        pg_conn.close()
+        dbpool.close(pg_conn, pg_cur)
 
 if __name__ == "__main__":
     main()
@@ -12,6 +12,7 @@ Yêu cầu:
 
 import os
 import re
+import sys
 import time
 import random
 import argparse
@@ -22,6 +23,10 @@ import psycopg2
 from psycopg2.extras import DictCursor
 from dotenv import load_dotenv
 
+# Lớp truy cập DB dùng chung với scraper (pool + DSN + timeout)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scrape_data", "scrape_data"))
+import dbpool
+
 # Selenium (undetected-chromedriver + WebDriverWait)
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
@@ -37,13 +42,6 @@ from selenium.common.exceptions import (
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-PGHOST = os.getenv("PGHOST", "localhost")
-PGPORT = int(os.getenv("PGPORT", "5432"))
-PGDATABASE = os.getenv("PGDATABASE")
-PGUSER = os.getenv("PGUSER")
-PGPASSWORD = os.getenv("PGPASSWORD")
-
 HEADLESS = os.getenv("SELENIUM_HEADLESS", "true").lower() == "true"
 WINDOW = os.getenv("SELENIUM_WINDOW", "1200x900")
 CHROME_BIN = os.getenv("SELENIUM_DRIVER_PATH", "").strip() or None
@@ -61,22 +59,17 @@ os.makedirs(DISK_CACHE_DIR, exist_ok=True)
 # DB helpers
 # ---------------------------------------------------------------------
 def get_conn():
-    """Kết nối Postgres + bật autocommit + timeouts để không treo."""
-    if DATABASE_URL:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
-    else:
-        if not (PGDATABASE and PGUSER and PGPASSWORD):
-            raise SystemExit("Thiếu cấu hình DB (DATABASE_URL hoặc PG*).")
-        conn = psycopg2.connect(
-            host=PGHOST, port=PGPORT, dbname=PGDATABASE, user=PGUSER, password=PGPASSWORD,
-            cursor_factory=DictCursor
-        )
+    """
+    Mượn kết nối từ pool dùng chung (scrape_data/scrape_data/dbpool.py; DSN: DATABASE_URL → PG* → config.PG_DSN)
+    + bật autocommit + timeouts để không treo. Trả lại bằng dbpool.release(conn).
+    """
+    conn = dbpool.acquire()
     conn.autocommit = True
+    conn.cursor_factory = DictCursor
     try:
-        with conn.cursor() as cur:
-            cur.execute("SET lock_timeout TO '1s';")         # chờ khóa tối đa 1s
-            cur.execute("SET statement_timeout TO '15s';")   # chạy truy vấn tối đa 15s
-            cur.execute("SET deadlock_timeout TO '1s';")
+        dbpool.set_session(conn, lock_timeout="1s",          # chờ khóa tối đa 1s
+                           statement_timeout="15s",          # chạy truy vấn tối đa 15s
+                           deadlock_timeout="1s")
     except Exception as e:
         logging.warning("Không đặt được DB timeouts: %s", e)
     return conn
@@ -477,7 +470,7 @@ def main():
             driver.quit()
         except Exception:
             pass
-        conn.close()
+        dbpool.release(conn)
 
     logging.info("Hoàn thành. Đã cập nhật %s/%s record", processed, to_process_total)
 